@@ -4,10 +4,11 @@ Create csv files representing joints positions for each mask.
 import csv
 import os
 import cv2
-from deep_pose.body import Body
+from deep_pose.engine import shared_engine
+from deep_pose.pose_result import PoseResult
 
-# OpenPose instance used to analyze camera frames.
-BODY_ESTIMATION = Body("deep_pose/body_pose_model.pth")
+# OpenPose engine used to analyze camera frames, shared with the game model.
+BODY_ESTIMATION = shared_engine("deep_pose/body_pose_model.pth", profile=True)
 
 # List of image names to analyze.
 MASK_NAMES = [
@@ -20,40 +21,61 @@ MASK_NAMES = [
     "seventh_mask",
 ]
 
-def analyze_image(image_name):
+def analyze_image(image_name, body_estimation=None):
     """
     This function analyzes a given image and returns the joint positions
-    found within it as a dictionary.
+    of the first person found within it.
 
     Args:
         image_name (str): The name of the image to analyze.
+        body_estimation (Body): The OpenPose instance to analyze the image
+            with. Defaults to BODY_ESTIMATION.
     Returns:
-        joint_positions (dict): A dictionary where each key is a string number
-            corresponding to a joint and each value is the pixel location of
-            the joint in the image, [-1, -1] if it is not found.
+        joint_positions (PoseResult): The pixel location of each joint in the
+            image, [-1, -1] if it is not found. It reads as a dictionary
+            where each key is a string number corresponding to a joint, and
+            is empty if the image or a person in it is not found.
     """
-    joint_positions = {}
+    if body_estimation is None:
+        body_estimation = BODY_ESTIMATION
     # All images to be analyzed are in the images/poses directory
-    if os.path.exists(f"images/poses/{image_name}.png"):
-        image = cv2.imread(f"images/poses/{image_name}.png")
-        # candidate is all the joints recognized by OpenPose and subset
-        # groups the joints in candidate by person (if multiple are detected)
-        candidate, subset = BODY_ESTIMATION(image)
-        for index, value in enumerate(subset[0]):
-            # if the value is 0, a particular joint was not found and should be
-            # mapped to [-1, -1] to indicate that.
-            if value >= 0:
-                joint_positions[f"{index}"] = [
-                    candidate[int(value)][0],
-                    candidate[int(value)][1],
-                ]
-            else:
-                joint_positions[f"{index}"] = [-1, -1]
-            # after index 16, subset contains information related to the
-            # accuracy of the neural network fit but not relevant information
-            # to joint positions.
-            if index >= 17:
-                break
+    if not os.path.exists(f"images/poses/{image_name}.png"):
+        return PoseResult()
+    image = cv2.imread(f"images/poses/{image_name}.png")
+    # candidate is all the joints recognized by OpenPose and subset
+    # groups the joints in candidate by person (if multiple are detected)
+    candidate, subset = body_estimation(image)
+    return PoseResult.from_subset(candidate, subset)
+
+def analyze_images(image_names, body_estimation=None):
+    """
+    This function analyzes several images at once and returns the joint
+    positions found within each of them. Images of the same size are run
+    through OpenPose together as one batch.
+
+    Args:
+        image_names (list): The names of the images to analyze.
+        body_estimation (Body): The OpenPose instance to analyze the images
+            with. Defaults to BODY_ESTIMATION.
+    Returns:
+        joint_positions (dict): A dictionary where each key is an image name
+            and each value is the PoseResult analyze_image would return for
+            that image.
+    """
+    if body_estimation is None:
+        body_estimation = BODY_ESTIMATION
+    joint_positions = {image_name: PoseResult() for image_name in image_names}
+    # group the images that exist by size, since a batch needs equal sizes
+    batches = {}
+    for image_name in image_names:
+        if os.path.exists(f"images/poses/{image_name}.png"):
+            image = cv2.imread(f"images/poses/{image_name}.png")
+            batches.setdefault(image.shape, []).append((image_name, image))
+    for batch in batches.values():
+        results = body_estimation.batch([image for _, image in batch])
+        for (image_name, _), (candidate, subset) in zip(batch, results):
+            joint_positions[image_name] = PoseResult.from_subset(
+                candidate, subset)
     return joint_positions
 
 def write_to_csv(csv_name, joint_positions):
@@ -63,9 +85,10 @@ def write_to_csv(csv_name, joint_positions):
 
     Args:
         csv_name (str): The name of the new csv file.
-        joint_positions (dict): A dictionary where each key is a string number
-            corresponding to a joint and each value is the pixel location of
-            the joint in the image, [-1, -1] if it is not found.
+        joint_positions (PoseResult): The joint positions, or a dictionary
+            where each key is a string number corresponding to a joint and
+            each value is the pixel location of the joint in the image,
+            [-1, -1] if it is not found.
     """
     with open(f"mask_joint_positions/{csv_name}.csv", "w") as csv_file:
         csv_writer = csv.writer(csv_file)
@@ -76,10 +99,11 @@ def main():
     """
     This is the main runner function to create csv files.
     """
-    # analyze each image in MASK_NAMES and write them to their own csvs.
+    # analyze all images in MASK_NAMES together and write each to its own
+    # csv.
+    all_joint_positions = analyze_images(MASK_NAMES)
     for file_name in MASK_NAMES:
-        joint_positions = analyze_image(file_name)
-        write_to_csv(file_name, joint_positions)
+        write_to_csv(file_name, all_joint_positions[file_name])
 
 if __name__ == "__main__":
     main()
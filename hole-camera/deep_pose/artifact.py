@@ -0,0 +1,63 @@
+"""
+Ready-to-run body model artifact for fast startup.
+
+The caffe-converted body_pose_model.pth needs util.transfer to rename every
+weight and a freshly initialized bodypose_model to load into. The artifact
+stores the weights already renamed, so Body can memory-map it and build the
+model on the meta device without initializing or copying any weights. Build
+it once from the game directory:
+
+    python -m deep_pose.artifact
+"""
+
+import argparse
+import os
+
+import torch
+
+import deep_pose.util as util
+from deep_pose.model import bodypose_model
+
+
+def artifact_path(model_path):
+    """Path of the artifact built from model_path."""
+    return os.path.splitext(model_path)[0] + '.artifact.pt'
+
+
+def is_fresh(model_path):
+    """Whether the artifact exists and is not older than model_path."""
+    return util.is_up_to_date(artifact_path(model_path), model_path)
+
+
+def build_artifact(model_path):
+    """Write the renamed, contiguous weights of model_path next to it."""
+    model = bodypose_model()
+    weights = util.transfer(model, torch.load(model_path, map_location='cpu'))
+    path = artifact_path(model_path)
+    torch.save({name: tensor.contiguous()
+                for name, tensor in weights.items()}, path)
+    return path
+
+
+def load_artifact(path, stages=6):
+    """Build bodypose_model(stages) directly on the memory-mapped weights."""
+    weights = torch.load(path, map_location='cpu', mmap=True,
+                         weights_only=True)
+    with torch.device('meta'):
+        model = bodypose_model(stages)
+    model.load_state_dict({name: weights[name]
+                           for name in model.state_dict()}, assign=True)
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='deep_pose/body_pose_model.pth')
+    args = parser.parse_args()
+    print('wrote %s' % build_artifact(args.model))
+
+
+if __name__ == '__main__':
+    main()
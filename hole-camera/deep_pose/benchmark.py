@@ -0,0 +1,211 @@
+"""
+Benchmark Body over the recorded pose frames and synthetic multi-person scenes.
+
+Every frame set is resized to each benchmark resolution and run under each
+scale_search setting. For every configuration the report lists p50/p95/p99
+latency of a whole Body call, the mean of each profiled stage, the peak
+resident set size of the process so far, with --trace-memory the largest
+peak of memory allocated within one call, and how many golden joints were
+found again within the per-part tolerances of deep_pose.golden. Golden
+outputs come from the default Body at the same frame set and resolution.
+Run from the game directory:
+
+    python -m deep_pose.benchmark --save-golden   # record golden outputs
+    python -m deep_pose.benchmark                 # benchmark against them
+    python -m deep_pose.benchmark --peak-mode lowres --precision int8
+    python -m deep_pose.benchmark --lean --trace-memory
+"""
+
+import argparse
+import os
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from deep_pose.body import Body
+from deep_pose.golden import compare_frame, load_golden, record, save_golden
+from deep_pose.util import load_images
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+RESOLUTIONS = ((320, 240), (640, 480), (1280, 720))
+SCALE_SEARCHES = ((0.5,), (1.0,), (0.5, 1.0))
+PEOPLE_PER_SCENE = (2, 3)
+STAGES = ['resize', 'forward', 'upsample', 'peaks', 'paf', 'assembly']
+
+
+def synthetic_scenes(images, people_per_scene=PEOPLE_PER_SCENE):
+    """Multi-person frames built by shrinking recorded poses side by side.
+
+    For n people, n consecutive frames are scaled down by n and placed next
+    to each other, centered vertically on a gray frame of the original size.
+    """
+    height, width = images[0][1].shape[:2]
+    scenes = []
+    for count in people_per_scene:
+        for start in range(0, len(images) - count + 1, count):
+            group = images[start:start + count]
+            scene = np.full((height, width, 3), 128, np.uint8)
+            top = (height - height // count) // 2
+            for i, (_, image) in enumerate(group):
+                small = cv2.resize(image, (width // count, height // count),
+                                   interpolation=cv2.INTER_AREA)
+                left = i * small.shape[1]
+                scene[top:top + small.shape[0],
+                      left:left + small.shape[1]] = small
+            name = '+'.join(os.path.splitext(n)[0] for n, _ in group)
+            scenes.append((name, scene))
+    return scenes
+
+
+def frame_sets(image_dir, resolutions=RESOLUTIONS):
+    """{(set name, (width, height)): [(frame name, frame)]} per resolution."""
+    poses = load_images(image_dir)
+    sets = {'poses': poses, 'scenes': synthetic_scenes(poses)}
+    return {
+        (set_name, resolution): [(name, cv2.resize(image, resolution))
+                                 for name, image in frames]
+        for set_name, frames in sets.items()
+        for resolution in resolutions
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unknown."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def golden_key(set_name, resolution, frame_name):
+    return '%s/%dx%d/%s' % ((set_name,) + tuple(resolution) + (frame_name,))
+
+
+def record_golden(path, model_path, sets):
+    """Record golden outputs of the default Body for every set and size."""
+    reference = Body(model_path)
+    outputs = {}
+    for (set_name, resolution), frames in sets.items():
+        for name, output in record(reference, frames).items():
+            outputs[golden_key(set_name, resolution, name)] = output
+    return save_golden(path, outputs)
+
+
+def run(body, frames, scale_search, repeat=3, golden=None, set_name='',
+        resolution=None):
+    """Benchmark one configuration and return its summary dict.
+
+    body's scale_search and profiling setting are restored afterwards.
+    """
+    original = body.scale_search, body.profiler.enabled
+    body.scale_search = list(scale_search)
+    body.profiler.enabled = True
+    try:
+        body(frames[0][1])  # warm-up, sizes the input buffers
+        body.profiler.reset()
+        matched = total = 0
+        call_peaks = []
+        for name, image in frames:
+            for _ in range(repeat):
+                result = body(image)
+                if body.peak_memory is not None:
+                    call_peaks.append(body.peak_memory)
+            key = golden_key(set_name, resolution, name)
+            if golden is not None and key in golden:
+                report = compare_frame(golden[key], result)
+                matched += report['agreeing']
+                total += report['joints']
+        stats = body.stats()
+    finally:
+        body.scale_search, body.profiler.enabled = original
+    return {
+        'p50': stats['total']['p50'],
+        'p95': stats['total']['p95'],
+        'p99': stats['total']['p99'],
+        'stages': {stage: stats[stage]['mean']
+                   for stage in STAGES if stage in stats},
+        'peak_rss_mb': peak_rss_mb(),
+        'call_mb': max(call_peaks) / 2. ** 20 if call_peaks else None,
+        'agreement': matched / float(total) if total else None,
+    }
+
+
+def benchmark(body, sets, scale_searches=SCALE_SEARCHES, repeat=3,
+              golden=None):
+    """run() over every frame set, resolution and scale_search setting.
+
+    Returns a list of (set name, resolution, scale_search, summary).
+    """
+    results = []
+    for (set_name, resolution), frames in sorted(sets.items()):
+        for scale_search in scale_searches:
+            summary = run(body, frames, scale_search, repeat, golden,
+                          set_name, resolution)
+            results.append((set_name, resolution, scale_search, summary))
+            print(format_row(set_name, resolution, scale_search, summary))
+    return results
+
+
+def format_row(set_name, resolution, scale_search, summary):
+    rss = summary['peak_rss_mb']
+    call = summary['call_mb']
+    agree = summary['agreement']
+    return '%-7s %9s %-9s %8.1f %8.1f %8.1f %8s %8s %7s  %s' % (
+        set_name, '%dx%d' % tuple(resolution),
+        ','.join('%g' % s for s in scale_search),
+        summary['p50'], summary['p95'], summary['p99'],
+        '%.0f' % rss if rss is not None else 'n/a',
+        '%.1f' % call if call is not None else 'n/a',
+        '%.1f%%' % (100 * agree) if agree is not None else 'n/a',
+        ' '.join('%s %.1f' % item for item in summary['stages'].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='deep_pose/body_pose_model.pth')
+    parser.add_argument('--images', default='images/poses')
+    parser.add_argument('--golden', default='deep_pose/golden_outputs.npz')
+    parser.add_argument('--save-golden', action='store_true',
+                        help='record golden outputs before benchmarking')
+    parser.add_argument('--repeat', type=int, default=3, help='calls per frame')
+    parser.add_argument('--peak-mode', default='full', choices=Body.PEAK_MODES)
+    parser.add_argument('--mode', default='multi', choices=Body.MODES)
+    parser.add_argument('--stages', type=int, default=6)
+    parser.add_argument('--precision', default='fp32', choices=Body.PRECISIONS)
+    parser.add_argument('--backend', default='torch', choices=Body.BACKENDS)
+    parser.add_argument('--batch-scales', action='store_true',
+                        help='run all scales in one forward pass')
+    parser.add_argument('--lean', action='store_true',
+                        help='reuse the work arrays of Body between calls')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='measure the memory allocated within each call')
+    args = parser.parse_args()
+
+    sets = frame_sets(args.images)
+    if args.save_golden:
+        print('wrote %s' % record_golden(args.golden, args.model, sets))
+    golden = load_golden(args.golden) if os.path.exists(args.golden) else None
+    if golden is None:
+        print('no golden outputs at %s, run with --save-golden to record '
+              'them' % args.golden)
+
+    body = Body(args.model, peak_mode=args.peak_mode, mode=args.mode,
+                stages=args.stages, precision=args.precision,
+                backend=args.backend, batch_scales=args.batch_scales or None,
+                lean=args.lean)
+    if args.trace_memory:
+        tracemalloc.start()
+    print('%-7s %9s %-9s %8s %8s %8s %8s %8s %7s  %s' % (
+        'set', 'size', 'scales', 'p50 ms', 'p95 ms', 'p99 ms', 'rss MB',
+        'call MB', 'agree', 'stage means (ms)'))
+    benchmark(body, sets, repeat=args.repeat, golden=golden)
+
+
+if __name__ == '__main__':
+    main()
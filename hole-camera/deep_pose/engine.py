@@ -0,0 +1,98 @@
+"""
+Lazily loaded, process-wide shared pose engine.
+
+shared_engine() hands out one PoseEngine per model path and set of Body
+options, so the game model, create_csv and the tests of one process share a
+single network. Nothing is loaded until start() or the first call. start()
+loads the weights and runs a warm-up inference on a background thread, so a
+loading screen can keep drawing meanwhile; a call made before warm-up has
+finished waits for it.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from deep_pose.body import Body
+
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+class PoseEngine:
+    """Handle to a Body that is built and warmed up on first use.
+
+    Calling the engine runs the Body on a frame; other Body attributes, such
+    as batch and stats, are forwarded to it. Both wait until the Body is
+    ready and re-raise any error raised while loading it. warmup_shape is the
+    shape of the blank frame used for the warm-up inference.
+    """
+
+    def __init__(self, model_path, warmup_shape=(480, 640, 3), **options):
+        self.model_path = model_path
+        self.warmup_shape = warmup_shape
+        self.options = options
+        self._body = None
+        self._error = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def start(self):
+        """Start loading on a background thread, once; returns the engine."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._load, name='pose-engine', daemon=True)
+                self._thread.start()
+        return self
+
+    def ready(self):
+        """Whether the Body is loaded and warmed up (or failed to load)."""
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        """Start loading if needed and wait up to timeout seconds.
+
+        Returns ready().
+        """
+        self.start()
+        return self._ready.wait(timeout)
+
+    @property
+    def body(self):
+        """The loaded Body, waiting for it if necessary."""
+        self.wait()
+        if self._error is not None:
+            raise self._error
+        return self._body
+
+    def _load(self):
+        try:
+            body = Body(self.model_path, **self.options)
+            body(np.zeros(self.warmup_shape, np.uint8))
+            # keep the warm-up call out of the latency statistics
+            body.profiler.reset()
+            self._body = body
+        except Exception as error:  # surfaced to the caller by body
+            self._error = error
+        finally:
+            self._ready.set()
+
+    def __call__(self, frame):
+        return self.body(frame)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.body, name)
+
+
+def shared_engine(model_path, **options):
+    """The process-wide PoseEngine for model_path and the given Body options."""
+    key = (os.path.abspath(model_path), repr(sorted(options.items())))
+    with _ENGINES_LOCK:
+        if key not in _ENGINES:
+            _ENGINES[key] = PoseEngine(model_path, **options)
+        return _ENGINES[key]
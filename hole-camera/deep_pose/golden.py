@@ -0,0 +1,196 @@
+"""
+Golden-output regression check for Body.
+
+`record` stores (candidate, subset) of the reference Body on a folder of
+frames in a compressed .npz file. `check` runs any other Body configuration
+(reduced stages, lowres peaks, int8, bf16, onnxruntime, ...) on the same
+frames, matches its people to the golden ones and reports every joint that
+moved further than its part's pixel tolerance, went missing or appeared.
+Run from the game directory:
+
+    python -m deep_pose.golden record
+    python -m deep_pose.golden check --precision int8
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+from deep_pose.body import Body
+from deep_pose.util import load_images, person_keypoints
+
+PART_NAMES = ['nose', 'neck', 'r_shoulder', 'r_elbow', 'r_wrist',
+              'l_shoulder', 'l_elbow', 'l_wrist', 'r_hip', 'r_knee',
+              'r_ankle', 'l_hip', 'l_knee', 'l_ankle', 'r_eye', 'l_eye',
+              'r_ear', 'l_ear']
+# allowed drift in pixels per part: tight on the face, looser on the
+# extremities
+TOLERANCES = np.array([6, 8, 8, 10, 12, 8, 10, 12, 10, 10, 12, 10, 10, 12,
+                       6, 6, 6, 6], np.float32)
+
+
+def record(body, frames):
+    """{frame name: (candidate, subset)} of body on frames."""
+    return {name: body(image) for name, image in frames}
+
+
+def save_golden(path, outputs):
+    """Store record() outputs compactly.
+
+    The candidate id column is its row index and is dropped; subset indices
+    are stored as int16 next to the float score and part count.
+    """
+    arrays = {}
+    for name, (candidate, subset) in outputs.items():
+        candidate = np.asarray(candidate, np.float32).reshape(-1, 4)
+        subset = np.asarray(subset, np.float32).reshape(-1, 20)
+        arrays[name + '/candidate'] = candidate[:, :3]
+        arrays[name + '/parts'] = subset[:, :18].astype(np.int16)
+        arrays[name + '/scores'] = subset[:, 18:]
+    np.savez_compressed(path, **arrays)
+    return path
+
+
+def load_golden(path):
+    """{frame name: (candidate, subset)} from a file written by save_golden."""
+    golden = {}
+    with np.load(path) as data:
+        for name in set(key.rsplit('/', 1)[0] for key in data.files):
+            candidate = data[name + '/candidate']
+            ids = np.arange(len(candidate), dtype=np.float32)[:, None]
+            parts = data[name + '/parts'].astype(np.float32)
+            subset = np.hstack([parts, data[name + '/scores']])
+            golden[name] = (np.hstack([candidate, ids]), subset)
+    return golden
+
+
+def match_people(expected, found):
+    """Greedily pair golden and found people by mean shared-joint distance.
+
+    expected and found are lists of 18 x 2 joint positions with NaN for
+    missing joints, as in person_keypoints. Returns a list of
+    (expected index, found index) pairs; people sharing no joint stay unpaired.
+    """
+    costs = []
+    for i, a in enumerate(expected):
+        for j, b in enumerate(found):
+            distances = np.linalg.norm(a - b, axis=1)
+            shared = ~np.isnan(distances)
+            if shared.any():
+                costs.append((distances[shared].mean(), i, j))
+    pairs = []
+    used_expected, used_found = set(), set()
+    for _, i, j in sorted(costs):
+        if i not in used_expected and j not in used_found:
+            pairs.append((i, j))
+            used_expected.add(i)
+            used_found.add(j)
+    return pairs
+
+
+def compare_frame(expected, found, tolerances=TOLERANCES):
+    """Compare one frame's (candidate, subset) against its golden output.
+
+    Returns a dict with the golden joint count, how many of them agree within
+    tolerance, the (part, pixel error) of joints beyond it, the parts of
+    golden joints that are missing and of found joints that are extra, the
+    people counts and whether the frame passed.
+    """
+    golden_people = [person_keypoints(expected[0], person)[:, :2]
+                     for person in expected[1]]
+    found_people = [person_keypoints(found[0], person)[:, :2]
+                    for person in found[1]]
+    report = {'joints': 0, 'agreeing': 0, 'errors': [], 'missing': [],
+              'extra': [], 'people': (len(golden_people), len(found_people))}
+    pairs = match_people(golden_people, found_people)
+    paired_found = set(j for _, j in pairs)
+    for i, a in enumerate(golden_people):
+        b = next((found_people[j] for g, j in pairs if g == i),
+                 np.full((18, 2), np.nan))
+        for part in range(18):
+            has_a, has_b = not np.isnan(a[part, 0]), not np.isnan(b[part, 0])
+            report['joints'] += has_a
+            if has_a and has_b:
+                error = float(np.linalg.norm(a[part] - b[part]))
+                if error <= tolerances[part]:
+                    report['agreeing'] += 1
+                else:
+                    report['errors'].append((part, error))
+            elif has_a:
+                report['missing'].append(part)
+            elif has_b:
+                report['extra'].append(part)
+    for j, b in enumerate(found_people):
+        if j not in paired_found:
+            report['extra'].extend(np.flatnonzero(~np.isnan(b[:, 0])).tolist())
+    report['passed'] = (report['people'][0] == report['people'][1]
+                        and not report['errors']
+                        and not report['missing']
+                        and not report['extra'])
+    return report
+
+
+def check(golden, body, frames, tolerances=TOLERANCES):
+    """{frame name: compare_frame report} of body on golden frames."""
+    return {name: compare_frame(golden[name], body(image), tolerances)
+            for name, image in frames if name in golden}
+
+
+def summarize(reports):
+    """Print one line per frame and an overall verdict.
+
+    Returns True if every frame passed.
+    """
+    for name, report in sorted(reports.items()):
+        problems = ['%s %.1fpx' % (PART_NAMES[part], error)
+                    for part, error in report['errors']]
+        problems += ['%s missing' % PART_NAMES[part]
+                     for part in report['missing']]
+        problems += ['%s extra' % PART_NAMES[part]
+                     for part in report['extra']]
+        if report['people'][0] != report['people'][1]:
+            problems.insert(
+                0, '%d people instead of %d' % report['people'][::-1])
+        verdict = 'ok' if report['passed'] else 'FAIL'
+        print('%-4s %-24s %s' % (verdict, name, ', '.join(problems)))
+    passed = sum(report['passed'] for report in reports.values())
+    joints = sum(report['joints'] for report in reports.values())
+    agreeing = sum(report['agreeing'] for report in reports.values())
+    print('%d/%d frames passed, %d/%d golden joints within tolerance'
+          % (passed, len(reports), agreeing, joints))
+    return passed == len(reports)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['record', 'check'])
+    parser.add_argument('--model', default='deep_pose/body_pose_model.pth')
+    parser.add_argument('--images', default='images/poses')
+    parser.add_argument('--golden', default='deep_pose/golden_poses.npz')
+    parser.add_argument('--tolerance-scale', type=float, default=1.0,
+                        help='multiplies every part tolerance')
+    parser.add_argument('--peak-mode', default='full', choices=Body.PEAK_MODES)
+    parser.add_argument('--mode', default='multi', choices=Body.MODES)
+    parser.add_argument('--stages', type=int, default=6)
+    parser.add_argument('--precision', default='fp32', choices=Body.PRECISIONS)
+    parser.add_argument('--backend', default='torch', choices=Body.BACKENDS)
+    args = parser.parse_args()
+
+    frames = load_images(args.images)
+    if args.command == 'record':
+        outputs = record(Body(args.model), frames)
+        print('wrote %s' % save_golden(args.golden, outputs))
+        return
+    body = Body(args.model, peak_mode=args.peak_mode, mode=args.mode,
+                stages=args.stages, precision=args.precision,
+                backend=args.backend)
+    reports = check(load_golden(args.golden), body, frames,
+                    TOLERANCES * args.tolerance_scale)
+    sys.exit(0 if summarize(reports) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -28,9 +28,38 @@ def make_layers(block, no_relu_layers):
 
     return nn.Sequential(OrderedDict(layers))
 
+def fold_input_normalization(model, scale=1 / 256., shift=-0.5):
+    """Absorb the x * scale + shift input normalization into conv1_1.
+
+    The folded model takes raw pixel values. conv1_1 is replaced by an
+    explicit pad with the raw value that normalizes to 0 followed by an
+    unpadded conv with scaled weights and a shifted bias, so the image
+    borders see the same zero padding as before.
+    """
+    conv = model.model0.conv1_1
+    folded = nn.Conv2d(conv.in_channels, conv.out_channels, conv.kernel_size, conv.stride, padding=0)
+    with torch.no_grad():
+        folded.weight.copy_(conv.weight * scale)
+        folded.bias.copy_(conv.bias + shift * conv.weight.sum(dim=(1, 2, 3)))
+    pad = nn.ConstantPad2d((conv.padding[1], conv.padding[1], conv.padding[0], conv.padding[0]), -shift / scale)
+    model.model0.conv1_1 = nn.Sequential(pad, folded).to(conv.weight.device)
+    return model
+
 class bodypose_model(nn.Module):
-    def __init__(self):
+    """Six-stage CPM body model.
+
+    stages (1-6) sets how many refinement stages forward runs; the L1 (PAF)
+    and L2 (heatmap) outputs of that stage are returned and later stages are
+    not built at all. With heatmap_only set, the L1 branch of the last stage
+    is skipped and forward returns None in its place.
+    """
+
+    def __init__(self, stages=6):
         super(bodypose_model, self).__init__()
+        if not 1 <= stages <= 6:
+            raise ValueError("stages must be between 1 and 6")
+        self.stages = stages
+        self.heatmap_only = False
 
         # these layers have no relu layer
         no_relu_layers = ['conv5_5_CPM_L1', 'conv5_5_CPM_L2', 'Mconv7_stage2_L1',\
@@ -79,7 +108,7 @@ class bodypose_model(nn.Module):
         self.model0 = make_layers(block0, no_relu_layers)
 
         # Stages 2 - 6
-        for i in range(2, 7):
+        for i in range(2, stages + 1):
             blocks['block%d_1' % i] = OrderedDict([
                     ('Mconv1_stage%d_L1' % i, [185, 128, 7, 1, 3]),
                     ('Mconv2_stage%d_L1' % i, [128, 128, 7, 1, 3]),
@@ -103,49 +132,25 @@ class bodypose_model(nn.Module):
         for k in blocks.keys():
             blocks[k] = make_layers(blocks[k], no_relu_layers)
 
-        self.model1_1 = blocks['block1_1']
-        self.model2_1 = blocks['block2_1']
-        self.model3_1 = blocks['block3_1']
-        self.model4_1 = blocks['block4_1']
-        self.model5_1 = blocks['block5_1']
-        self.model6_1 = blocks['block6_1']
-
-        self.model1_2 = blocks['block1_2']
-        self.model2_2 = blocks['block2_2']
-        self.model3_2 = blocks['block3_2']
-        self.model4_2 = blocks['block4_2']
-        self.model5_2 = blocks['block5_2']
-        self.model6_2 = blocks['block6_2']
+        for i in range(1, stages + 1):
+            setattr(self, 'model%d_1' % i, blocks['block%d_1' % i])
+        for i in range(1, stages + 1):
+            setattr(self, 'model%d_2' % i, blocks['block%d_2' % i])
 
 
     def forward(self, x):
 
         out1 = self.model0(x)
 
-        out1_1 = self.model1_1(out1)
-        out1_2 = self.model1_2(out1)
-        out2 = torch.cat([out1_1, out1_2, out1], 1)
-
-        out2_1 = self.model2_1(out2)
-        out2_2 = self.model2_2(out2)
-        out3 = torch.cat([out2_1, out2_2, out1], 1)
-
-        out3_1 = self.model3_1(out3)
-        out3_2 = self.model3_2(out3)
-        out4 = torch.cat([out3_1, out3_2, out1], 1)
-
-        out4_1 = self.model4_1(out4)
-        out4_2 = self.model4_2(out4)
-        out5 = torch.cat([out4_1, out4_2, out1], 1)
-
-        out5_1 = self.model5_1(out5)
-        out5_2 = self.model5_2(out5)
-        out6 = torch.cat([out5_1, out5_2, out1], 1)
-
-        out6_1 = self.model6_1(out6)
-        out6_2 = self.model6_2(out6)
+        for i in range(1, self.stages + 1):
+            out = out1 if i == 1 else torch.cat([out_1, out_2, out1], 1)
+            if i == self.stages and self.heatmap_only:
+                out_1 = None
+            else:
+                out_1 = getattr(self, 'model%d_1' % i)(out)
+            out_2 = getattr(self, 'model%d_2' % i)(out)
 
-        return out6_1, out6_2
+        return out_1, out_2
 
 class handpose_model(nn.Module):
     def __init__(self):
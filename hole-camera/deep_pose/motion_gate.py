@@ -0,0 +1,65 @@
+"""
+Motion gate in front of a pose estimator.
+
+Players often hold their pose, so consecutive frames of a live-scoring loop
+tend to give the same joints. MotionGate compares a small grayscale
+thumbnail of each frame with the one of the last analysed frame and, while
+the mean absolute difference stays under a threshold, returns the last
+(candidate, subset) instead of running the network again.
+"""
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Reuse the last pose while the scene is static.
+
+    body is any callable returning (candidate, subset) for a frame, such as
+    Body or a PoseEngine. threshold is the mean absolute difference, in gray
+    levels (0-255), under which a frame counts as unchanged; size is the
+    (width, height) of the thumbnails compared.
+    """
+
+    def __init__(self, body, threshold=3.0, size=(80, 60)):
+        self.body = body
+        self.threshold = threshold
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._last_thumbnail = None
+        self._last_result = None
+
+    def thumbnail(self, frame):
+        """Downscaled grayscale copy of frame as float32."""
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            return small.mean(axis=2, dtype=np.float32)
+        return small.astype(np.float32)
+
+    def __call__(self, frame):
+        thumbnail = self.thumbnail(frame)
+        if self._last_thumbnail is not None and np.abs(
+                thumbnail - self._last_thumbnail).mean() <= self.threshold:
+            self.hits += 1
+            return self._last_result
+        self.misses += 1
+        self._last_result = self.body(frame)
+        # compare against the last analysed frame, so slow drifts add up
+        self._last_thumbnail = thumbnail
+        return self._last_result
+
+    def reset(self):
+        """Forget the last frame, so the next call always runs the network."""
+        self._last_thumbnail = None
+        self._last_result = None
+
+    def hit_rate(self):
+        """Share of calls answered from the cache."""
+        calls = self.hits + self.misses
+        return self.hits / float(calls) if calls else 0.0
+
+    def stats(self):
+        """Hit and miss counts and the hit rate."""
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate()}
@@ -0,0 +1,76 @@
+"""
+ONNX Runtime backend for the body model, used by Body(backend='onnxruntime').
+
+bodypose_model is exported to ONNX once, with dynamic batch, height and width,
+and cached next to body_pose_model.pth under a name carrying EXPORT_VERSION.
+Inference then runs on onnxruntime's CPU execution provider with all graph
+optimizations enabled. onnxruntime is only imported when this backend is
+used.
+"""
+
+import inspect
+import os
+
+import torch
+
+import deep_pose.util as util
+
+# Bumped whenever export_onnx writes a different graph, so older exports are
+# not picked up
+EXPORT_VERSION = 2
+
+
+def onnx_model_path(model_path, stages=6):
+    """Path of the ONNX export of model_path, e.g. body_pose_model.v2.onnx."""
+    root = os.path.splitext(model_path)[0]
+    if stages != 6:
+        root += '_stages%d' % stages
+    return root + '.v%d.onnx' % EXPORT_VERSION
+
+
+def is_fresh_export(path, model_path):
+    """Whether the export at path exists and is not older than model_path."""
+    return util.is_up_to_date(path, model_path)
+
+
+def export_onnx(model, path):
+    """Export a float bodypose_model to path with dynamic batch and size."""
+    example = torch.zeros(1, 3, 184, 248)
+    spatial = {0: 'batch', 2: 'height', 3: 'width'}
+    kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        # the TorchScript exporter handles dynamic_axes without onnxscript
+        kwargs['dynamo'] = False
+    torch.onnx.export(model.cpu().eval(), (example,), path,
+                      input_names=['image'], output_names=['paf', 'heatmap'],
+                      dynamic_axes={'image': spatial, 'paf': spatial,
+                                    'heatmap': spatial},
+                      opset_version=13, **kwargs)
+    return path
+
+
+class OnnxRuntimeModel:
+    """Callable stand-in for bodypose_model backed by an onnxruntime session.
+
+    threads sets the intra-op thread pool (all cores by default); a single
+    inter-op thread with sequential execution suits this chain-shaped graph.
+    """
+
+    def __init__(self, path, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_ENABLE_ALL)
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = threads or os.cpu_count() or 1
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            path, options, providers=['CPUExecutionProvider'])
+
+    def __call__(self, data):
+        paf, heatmap = self.session.run(None, {'image': data.cpu().numpy()})
+        return torch.from_numpy(paf), torch.from_numpy(heatmap)
+
+    def eval(self):
+        return self
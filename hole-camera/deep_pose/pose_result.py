@@ -0,0 +1,89 @@
+"""
+Compact pose of one person.
+
+Body returns every peak it found (candidate) and the people they form
+(subset, indexes into candidate padded with -1). PoseResult keeps only the
+18 joints of one person: an (18, 3) float32 array of x, y and score, with
+(-1, -1, 0) for joints that were not found, and an integer bitmask of the
+joints that were. For code written against the old joint-position dicts it
+also reads as a mapping from the joint number as a string to [x, y].
+"""
+
+from collections.abc import Mapping
+
+import numpy as np
+
+from deep_pose.util import person_keypoints
+
+PARTS = 18
+
+
+class PoseResult(Mapping):
+    """Joints of one person, see the module docstring.
+
+    keypoints is the (PARTS, 3) float32 array and valid_mask has bit i set
+    when joint i was found. xy, scores and valid are views or cheap
+    derivations of them. An empty result (no person found) has no valid
+    joints and reads as an empty mapping.
+    """
+
+    __slots__ = ('keypoints', 'valid_mask')
+
+    def __init__(self, keypoints=None, valid_mask=0):
+        if keypoints is None:
+            keypoints = np.full((PARTS, 3), -1, np.float32)
+            keypoints[:, 2] = 0
+        self.keypoints = keypoints
+        self.valid_mask = int(valid_mask)
+
+    @classmethod
+    def from_subset(cls, candidate, subset, person=0):
+        """Joints of subset row `person`; empty if there is no such row."""
+        if len(subset) <= person:
+            return cls()
+        keypoints = person_keypoints(candidate, subset[person])
+        found = ~np.isnan(keypoints[:, 0])
+        keypoints[~found] = (-1, -1, 0)
+        return cls(keypoints, int(np.sum(1 << np.flatnonzero(found))))
+
+    @property
+    def xy(self):
+        """(PARTS, 2) view of the joint positions."""
+        return self.keypoints[:, :2]
+
+    @property
+    def scores(self):
+        """(PARTS,) view of the joint scores."""
+        return self.keypoints[:, 2]
+
+    @property
+    def valid(self):
+        """(PARTS,) bool array of the joints that were found."""
+        return (self.valid_mask >> np.arange(PARTS)) & 1 == 1
+
+    def is_valid(self, part):
+        """Whether joint `part` was found."""
+        return bool(self.valid_mask >> part & 1)
+
+    def __getitem__(self, key):
+        try:
+            part = int(key)
+        except (TypeError, ValueError):
+            raise KeyError(key)
+        if not self.valid_mask or not 0 <= part < PARTS:
+            raise KeyError(key)
+        if not self.is_valid(part):
+            return [-1, -1]
+        return self.keypoints[part, :2].tolist()
+
+    def __iter__(self):
+        if self.valid_mask:
+            for part in range(PARTS):
+                yield str(part)
+
+    def __len__(self):
+        return PARTS if self.valid_mask else 0
+
+    def __repr__(self):
+        return 'PoseResult(%d of %d joints)' % (
+            bin(self.valid_mask).count('1'), PARTS)
@@ -0,0 +1,92 @@
+"""
+Per-stage latency profiler for Body.
+
+Each named stage keeps its most recent durations in a rolling window, from
+which stats() reports percentiles and a histogram over fixed millisecond
+buckets. While disabled, timing a stage costs one method call that returns a
+shared no-op context manager.
+"""
+
+import collections
+import contextlib
+import threading
+import time
+
+import numpy as np
+
+# upper edges, in milliseconds, of the histogram buckets reported by stats()
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_DISABLED = contextlib.nullcontext()
+
+
+class StageProfiler:
+    """Rolling per-stage timings.
+
+    Use as `with profiler('forward'): ...`. window is the number of recent
+    samples kept per stage. Stages may be timed from several threads at once,
+    as Body.batch does.
+    """
+
+    def __init__(self, enabled=False, window=500):
+        self.enabled = enabled
+        self.window = window
+        self._samples = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, stage):
+        if not self.enabled:
+            return _DISABLED
+        return self._timed(stage)
+
+    @contextlib.contextmanager
+    def _timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            if stage not in self._samples:
+                self._samples[stage] = collections.deque(maxlen=self.window)
+            self._samples[stage].append(seconds * 1000)
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    def stats(self):
+        """Summary of every stage seen so far, in milliseconds.
+
+        Returns {stage: {'count', 'mean', 'p50', 'p95', 'p99', 'max',
+        'histogram'}}, where histogram maps each BUCKETS_MS edge (and
+        'inf') to the number of samples up to that edge.
+        """
+        with self._lock:
+            samples = [(stage, np.array(stage_samples))
+                       for stage, stage_samples in self._samples.items()]
+        summary = collections.OrderedDict()
+        for stage, ms in samples:
+            counts = np.histogram(ms, bins=(0,) + BUCKETS_MS + (np.inf,))[0]
+            summary[stage] = {
+                'count': len(ms),
+                'mean': float(ms.mean()),
+                'p50': float(np.percentile(ms, 50)),
+                'p95': float(np.percentile(ms, 95)),
+                'p99': float(np.percentile(ms, 99)),
+                'max': float(ms.max()),
+                'histogram': collections.OrderedDict(
+                    zip(BUCKETS_MS + ('inf',), counts.tolist())),
+            }
+        return summary
+
+    def report(self):
+        """stats() formatted as a text table."""
+        lines = ['%-12s %6s %9s %9s %9s %9s' % (
+            'stage', 'count', 'mean ms', 'p50 ms', 'p95 ms', 'max ms')]
+        for stage, s in self.stats().items():
+            lines.append('%-12s %6d %9.1f %9.1f %9.1f %9.1f' % (
+                stage, s['count'], s['mean'], s['p50'], s['p95'], s['max']))
+        return '\n'.join(lines)
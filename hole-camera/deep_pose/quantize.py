@@ -0,0 +1,114 @@
+"""
+Calibrate and check the int8 body pose model used by Body(precision='int8').
+
+The float model is statically quantized with FX graph mode quantization:
+activation ranges are observed on the recorded pose frames, the result is
+traced to TorchScript and cached next to body_pose_model.pth. Run from the
+game directory:
+
+    python -m deep_pose.quantize              # calibrate on images/poses
+    python -m deep_pose.quantize --validate   # keypoint drift against float
+"""
+
+import argparse
+
+import numpy as np
+import torch
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+import deep_pose.util as util
+from deep_pose.body import Body, normalize_input, resize_padded
+from deep_pose.model import bodypose_model
+
+
+def quantize(model_path, images, stages=6, backend='x86'):
+    """Calibrate an int8 copy of the body model on images and save it.
+
+    Returns the path of the cached TorchScript model.
+    """
+    model = bodypose_model(stages)
+    weights = torch.load(model_path, map_location='cpu')
+    model.load_state_dict(util.transfer(model, weights))
+    model.eval()
+
+    torch.backends.quantized.engine = backend
+    example = torch.zeros(1, 3, 184, 248)
+    prepared = prepare_fx(model, get_default_qconfig_mapping(backend),
+                          (example,))
+    with torch.no_grad():
+        for _, image in images:
+            # same input scale and padding Body uses
+            scale = 0.5 * Body.BOXSIZE / image.shape[0]
+            padded, _ = resize_padded(image, scale, Body.STRIDE,
+                                      Body.PAD_VALUE)
+            data = torch.from_numpy(padded).permute(2, 0, 1)[None].float()
+            prepared(normalize_input(data))
+        quantized = torch.jit.trace(convert_fx(prepared), (example,))
+
+    path = util.quantized_model_path(model_path, stages)
+    torch.jit.save(quantized, path)
+    return path
+
+
+def joints(candidate, subset):
+    """18 x 2 joint positions of the first person, NaN for missing joints."""
+    if len(subset) == 0:
+        return np.full((18, 2), np.nan, np.float32)
+    return util.person_keypoints(candidate, subset[0])[:, :2]
+
+
+def validate(model_path, images, stages=6):
+    """Compare int8 keypoints against the float model on images.
+
+    Returns a dict with the mean and max drift in pixels over joints both
+    models found, and how many joints only one of them found.
+    """
+    reference = Body(model_path, stages=stages)
+    quantized = Body(model_path, stages=stages, precision='int8')
+    drift = []
+    mismatched = 0
+    for name, image in images:
+        expected = joints(*reference(image))
+        found = joints(*quantized(image))
+        both = ~np.isnan(expected[:, 0]) & ~np.isnan(found[:, 0])
+        distances = np.linalg.norm(expected[both] - found[both], axis=1)
+        mismatched += int(np.sum(np.isnan(expected[:, 0])
+                                 != np.isnan(found[:, 0])))
+        drift.extend(distances)
+        print('%-20s mean drift %6.2f px  max drift %6.2f px' % (
+            name, distances.mean() if len(distances) else 0,
+            distances.max() if len(distances) else 0))
+    return {
+        'mean_drift': float(np.mean(drift)) if drift else 0.0,
+        'max_drift': float(np.max(drift)) if drift else 0.0,
+        'mismatched_joints': mismatched,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='deep_pose/body_pose_model.pth')
+    parser.add_argument('--images', default='images/poses')
+    parser.add_argument('--stages', type=int, default=6)
+    parser.add_argument('--backend', default='x86',
+                        choices=torch.backends.quantized.supported_engines)
+    parser.add_argument('--validate', action='store_true',
+                        help='only report drift of the cached int8 model')
+    args = parser.parse_args()
+
+    images = util.load_images(args.images)
+    if not args.validate:
+        path = quantize(args.model, images, args.stages, args.backend)
+        print('wrote %s (calibrated on %d images)' % (path, len(images)))
+    summary = validate(args.model, images, args.stages)
+    print('overall mean drift %.2f px, max drift %.2f px, '
+          '%d joints found by only one model'
+          % (summary['mean_drift'], summary['max_drift'],
+             summary['mismatched_joints']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Keypoint tracking between sparse pose inferences.
+
+On a CPU that runs Body about twice a second, KeypointTracker still gives
+joint positions for every camera frame: it runs Body only every `interval`
+frames, or sooner when tracking confidence drops, and moves the 18 joints of
+the player along with the image in between using pyramidal Lucas-Kanade
+optical flow. The tracked positions are smoothed by a One-Euro filter, which
+removes jitter when the player is still without adding lag when they move.
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from deep_pose.util import person_keypoints
+
+
+def person_with_most_joints(candidate, subset):
+    """18 x 2 joints of the subset row with the most parts, NaN if missing."""
+    if len(subset) == 0:
+        return np.full((18, 2), np.nan, np.float32)
+    person = subset[int(np.argmax([row[19] for row in subset]))]
+    return person_keypoints(candidate, person)[:, :2]
+
+
+class OneEuroFilter:
+    """One-Euro low-pass filter over an array of coordinates.
+
+    min_cutoff (Hz) sets the smoothing of slow movements and beta how fast
+    the cutoff rises with speed (in pixels per second). NaN entries are
+    passed through and restart the filter for that coordinate.
+    """
+
+    def __init__(self, min_cutoff=1.0, beta=0.02, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self._x = None
+        self._dx = None
+        self._t = None
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        tau = 1.0 / (2 * np.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(self, x, t):
+        x = np.asarray(x, np.float32)
+        if self._x is None or self._x.shape != x.shape or t <= self._t:
+            self._x, self._dx, self._t = x.copy(), np.zeros_like(x), t
+            return x.copy()
+        dt = t - self._t
+        # coordinates that just (re)appeared start from their raw value
+        fresh = np.isnan(self._x) & ~np.isnan(x)
+        previous = np.where(fresh, x, self._x)
+        dx = (x - previous) / dt
+        a_d = self._alpha(self.d_cutoff, dt)
+        dx_hat = a_d * dx + (1 - a_d) * np.where(fresh, 0, self._dx)
+        a = self._alpha(self.min_cutoff + self.beta * np.abs(dx_hat), dt)
+        x_hat = a * x + (1 - a) * previous
+        self._x, self._dx, self._t = x_hat, np.nan_to_num(dx_hat), t
+        return x_hat.copy()
+
+
+class KeypointTracker:
+    """Joint positions of one player at camera frame rate.
+
+    body is any callable returning (candidate, subset), such as Body or a
+    PoseEngine. Body runs on the first frame, then every `interval` frames
+    and whenever the share of detected joints still tracked falls below
+    min_confidence. A joint is dropped when its forward-backward optical
+    flow error exceeds max_flow_error pixels. Calling the tracker returns an
+    18 x 2 float32 array with NaN for joints not found.
+    """
+
+    def __init__(self, body, interval=10, min_confidence=0.6,
+                 max_flow_error=2.0, min_cutoff=1.0, beta=0.02):
+        self.body = body
+        self.interval = interval
+        self.min_confidence = min_confidence
+        self.max_flow_error = max_flow_error
+        self.filter = OneEuroFilter(min_cutoff, beta)
+        criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+        self.lk_params = dict(winSize=(21, 21), maxLevel=3, criteria=criteria)
+        self.inferences = 0
+        self.tracked_frames = 0
+        self.confidence = 0.0
+        self.reset()
+
+    def reset(self):
+        """Drop the tracked joints so the next frame runs Body."""
+        self._gray = None
+        self._joints = None
+        self._detected = 0
+        self._since_inference = 0
+        self.filter.reset()
+
+    def __call__(self, frame, timestamp=None):
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        gray = frame.astype(np.uint8, copy=False)
+        if gray.ndim == 3:
+            gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+        lost = self._detected and self.confidence < self.min_confidence
+        due = self._since_inference >= self.interval
+        if self._joints is None or due or lost:
+            self._infer(frame)
+        else:
+            self._track(gray)
+        self._gray = gray
+        self._since_inference += 1
+        return self.filter(self._joints, timestamp)
+
+    def _infer(self, frame):
+        self._joints = person_with_most_joints(*self.body(frame))
+        self._detected = int(np.sum(~np.isnan(self._joints[:, 0])))
+        self._since_inference = 0
+        self.confidence = 1.0 if self._detected else 0.0
+        self.inferences += 1
+
+    def _track(self, gray):
+        self.tracked_frames += 1
+        valid = ~np.isnan(self._joints[:, 0])
+        if not valid.any():
+            self.confidence = 0.0
+            return
+        p0 = self._joints[valid].reshape(-1, 1, 2)
+        p1, status, _ = cv2.calcOpticalFlowPyrLK(
+            self._gray, gray, p0, None, **self.lk_params)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(
+            gray, self._gray, p1, None, **self.lk_params)
+        error = np.linalg.norm((p0 - back).reshape(-1, 2), axis=1)
+        good = ((status.ravel() == 1) & (back_status.ravel() == 1)
+                & (error <= self.max_flow_error))
+        moved = np.full((int(valid.sum()), 2), np.nan, np.float32)
+        moved[good] = p1.reshape(-1, 2)[good]
+        self._joints[valid] = moved
+        self.confidence = float(good.sum()) / self._detected
+
+    def stats(self):
+        """How many frames ran Body and how many were tracked."""
+        frames = self.inferences + self.tracked_frames
+        rate = self.inferences / float(frames) if frames else 0.0
+        return {'inferences': self.inferences,
+                'tracked_frames': self.tracked_frames,
+                'inference_rate': rate,
+                'confidence': self.confidence}
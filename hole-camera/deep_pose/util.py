@@ -5,11 +5,13 @@ script is a utility script with helper functions that can be used to visualize
 the deep pose result.
 """
 
-import numpy as np
-import math
+import glob
+import os
 import cv2
 import numpy as np
 
+from deep_pose.skeleton import SkeletonRenderer
+
 def padRightDownCorner(img, stride, padValue):
     h = img.shape[0]
     w = img.shape[1]
@@ -39,41 +41,37 @@ def transfer(model, model_weights):
         transfered_model_weights[weights_name] = model_weights['.'.join(weights_name.split('.')[1:])]
     return transfered_model_weights
 
+# whether a file cached from source exists and is not older than it
+def is_up_to_date(path, source):
+    if not os.path.exists(path):
+        return False
+    return not os.path.exists(source) or os.path.getmtime(path) >= os.path.getmtime(source)
+
+# path of the calibrated int8 model written next to the float weights
+def quantized_model_path(model_path, stages=6):
+    root = os.path.splitext(model_path)[0]
+    if stages != 6:
+        root += '_stages%d' % stages
+    return root + '.int8.pt'
+
+# every png/jpg frame in image_dir as (file name, image), sorted by name
+def load_images(image_dir):
+    paths = sorted(glob.glob(os.path.join(image_dir, '*.png')) + glob.glob(os.path.join(image_dir, '*.jpg')))
+    return [(os.path.basename(path), cv2.imread(path)) for path in paths]
+
+# x, y and score of the 18 joints of one subset row, NaN for missing joints
+def person_keypoints(candidate, person):
+    keypoints = np.full((18, 3), np.nan, np.float32)
+    indexes = np.asarray(person[:18]).astype(int)
+    found = indexes >= 0
+    if found.any():
+        keypoints[found] = np.asarray(candidate, np.float32)[indexes[found], :3]
+    return keypoints
+
 # draw the body keypoint and lims
 def draw_bodypose(canvas, candidate, subset):
-    stickwidth = 40
-    limbSeq = [[2, 3], [2, 6], [3, 4], [4, 5], [6, 7], [7, 8], [2, 9], [9, 10], \
-               [10, 11], [2, 12], [12, 13], [13, 14], [2, 1], [1, 15], [15, 17], \
-               [1, 16], [16, 18], [3, 17], [6, 18]]
-
-    colors = [[255, 0, 0], [255, 85, 0], [255, 170, 0], [255, 255, 0], [170, 255, 0], [85, 255, 0], [0, 255, 0], \
-              [0, 255, 85], [0, 255, 170], [0, 255, 255], [0, 170, 255], [0, 85, 255], [0, 0, 255], [85, 0, 255], \
-              [170, 0, 255], [255, 0, 255], [255, 0, 170], [255, 0, 85]]
-    for i in range(18):
-        for n in range(len(subset)):
-            index = int(subset[n][i])
-            if index == -1:
-                continue
-            x, y = candidate[index][0:2]
-            cv2.circle(canvas, (int(x), int(y)), 4, colors[i], thickness=-1)
-    for i in range(17):
-        for n in range(len(subset)):
-            index = subset[n][np.array(limbSeq[i]) - 1]
-            if -1 in index:
-                continue
-            cur_canvas = canvas.copy()
-            Y = candidate[index.astype(int), 0]
-            X = candidate[index.astype(int), 1]
-            mX = np.mean(X)
-            mY = np.mean(Y)
-            length = ((X[0] - X[1]) ** 2 + (Y[0] - Y[1]) ** 2) ** 0.5
-            angle = math.degrees(math.atan2(X[0] - X[1], Y[0] - Y[1]))
-            polygon = cv2.ellipse2Poly((int(mY), int(mX)), (int(length / 2), stickwidth), int(angle), 0, 360, 1)
-            cv2.fillConvexPoly(cur_canvas, polygon, colors[i])
-            canvas = cv2.addWeighted(canvas, 0.4, cur_canvas, 0.6, 0)
-    # plt.imsave("preview.jpg", canvas[:, :, [2, 1, 0]])
-    # plt.imshow(canvas[:, :, [2, 1, 0]])
-    return canvas
+    # all limbs go into one overlay that is blended once, see deep_pose.skeleton
+    return SkeletonRenderer(stick_width=40).draw(canvas, candidate, subset)
 
 # get max index of 2d array
 def npmax(array):
@@ -6,11 +6,13 @@ that can analyze an image for joint positions in terms of pixel locations for
 each joint. This repository can be found at this link:
 https://github.com/Hzzone/pytorch-openpose
 """
-import csv
 import random
+from concurrent.futures import Future
 from cv2 import cv2 as cv
 import numpy as np
-from deep_pose.body import Body
+from deep_pose.engine import shared_engine
+from deep_pose.pose_result import PoseResult
+from deep_pose.worker import PoseWorker
 
 
 class HoleInTheCameraGame:
@@ -18,17 +20,20 @@ class HoleInTheCameraGame:
     Hole in the wall game model with helper functions that dictate gameflow.
 
     Attributes:
-        BODY_ESTIMATION (Body): Body estimation object from open pose.
+        BODY_ESTIMATION (PoseEngine): Shared, lazily loaded body estimation
+            object from open pose.
+        POSE_WORKER (PoseWorker): Open pose running in a separate process,
+            used by analyze_frame_async.
         MASK_NAMES (list): List of names of each mask, represented as strings.
         _mask_and_joints (list): List of tuples, where each tuple contains the
             string file path to the mask that a user should fit into and a
             string file path to the csv that stores the joint positions users
             need to match.
-        _joint_positions (dict): Dictionary of joint positions, where each key
-            is an integer representing a joint (joint to integer conversions
-            can be found in the openpose github) and each value is a list of
-            doubles representing the pixel location of a joint on a given
-            image.
+        _joint_positions (PoseResult): Joint positions of the player, stored
+            as an 18x3 array of pixel locations and scores with a bitmask of
+            the joints found (joint to integer conversions can be found in the
+            openpose github). It also reads as a dictionary from each joint
+            number, as a string, to its pixel location.
         _joint_candidates (list): 2-D list of all joints, their positions, and
             the confidence of the open pose neural network, for every joint
             detected within the image inputted to open pose.
@@ -36,19 +41,41 @@ class HoleInTheCameraGame:
             person detected within the inputted image. This list contains joint
             indexes, separated by person, within the joint_candidates list and
             can be parsed to determine all the joints for each person.
+        _reference_joints (numpy.ndarray): The joint positions users need to
+            match for every mask, as a masks x 18 x 2 array loaded once from
+            the joint positions csvs, [-1, -1] where a joint is not in the
+            mask.
+        _reference_valid (numpy.ndarray): A masks x 18 boolean array that is
+            True where a mask's joint was found.
+        _reference_index (dict): Maps the path of each joint positions csv to
+            its row in _reference_joints.
         _trial_score (double): The computed score of the user's fit for the
             most recently played trial in the game.
         _total_score (double): The computer score of the user's fit for all
             trials played up to the current condition of the game.
     """
 
-    # Instance of Body class from open pose that will be used to analyze frames.
-    BODY_ESTIMATION = Body("deep_pose/body_pose_model.pth")
+    # Open pose engine shared by the whole process that will be used to analyze
+    # frames with analyze_frame. Its weights are loaded on first use.
+    BODY_ESTIMATION = shared_engine("deep_pose/body_pose_model.pth",
+                                    profile=True)
+
+    # Open pose worker process, started by the runner so that analyzing the
+    # final frame does not freeze the game window. While the runner's
+    # SHOW_SKELETON is on it also analyzes the live frames of each round, so
+    # its stats() hold the game's pose estimation latency; otherwise only the
+    # final frame of each round.
+    POSE_WORKER = PoseWorker("deep_pose/body_pose_model.pth", profile=True)
 
     # List of each mask that will be available for users to play with.
     MASK_NAMES = ["first_mask", "second_mask", "third_mask", "fourth_mask",
                   "fifth_mask", "sixth_mask", "seventh_mask",]
 
+    # Distances (in pixels) under which a joint earns the credit at the same
+    # position in _FIT_CREDITS; joints further away earn the last credit.
+    _FIT_DISTANCES = np.array([30, 40, 50])
+    _FIT_CREDITS = np.array([1, 0.5, 0.25, 0])
+
     def __init__(self):
         """
         This is the constructor for the HoleInTheCamera class. The constructor
@@ -69,7 +96,13 @@ class HoleInTheCameraGame:
             frame = cv.resize(frame, (640, 480))
             joints = f"mask_joint_positions/{mask}.csv"
             self._mask_and_joints.append((frame, joints))
-        self._joint_positions = {}
+        # The joints of every mask are read once, so scoring a fit needs no
+        # file access.
+        joint_paths = [joints for _, joints in self._mask_and_joints]
+        self._reference_index = {path: i for i, path in enumerate(joint_paths)}
+        self._reference_joints, self._reference_valid =\
+            self.load_reference_joints(joint_paths)
+        self._joint_positions = PoseResult()
         self._joint_candidates = []
         self._joint_subsets = []
         self._total_score = 0
@@ -78,7 +111,7 @@ class HoleInTheCameraGame:
     @property
     def joint_positions(self):
         """
-        Return the joint_positions dictionary stored by this HoleInTheCamera
+        Return the joint_positions PoseResult stored by this HoleInTheCamera
         instance.
         """
         return self._joint_positions
@@ -169,29 +202,97 @@ class HoleInTheCameraGame:
         self._joint_candidates, self._joint_subsets =\
             self.BODY_ESTIMATION(frame)
 
+    def analyze_frame_async(self, frame):
+        """
+        This function sends the inputted frame to the open pose worker process
+        and returns right away. Once the worker is done, the joints are stored
+        to _joint_candidates and _joint_subsets as analyze_frame would.
+
+        Args:
+            frame (numpy.ndarray): A 3-D numpy array that represents the RGB
+                values of the frame to be analyzed by open pose. This frame
+                array should be of size 480x640x3.
+        Returns:
+            (Future): A future that is done once the joints are stored, or
+                that raises the error the worker ran into.
+        """
+        stored = Future()
+
+        def store_joints(analysis):
+            if analysis.exception() is not None:
+                stored.set_exception(analysis.exception())
+                return
+            self._joint_candidates, self._joint_subsets = analysis.result()
+            stored.set_result(None)
+
+        self.POSE_WORKER.submit(frame).add_done_callback(store_joints)
+        return stored
+
     def parse_for_joint_positions(self):
         """
         This function is called after a frame is analyzed and potential joints
         are populated to _joint_candidates and _joint_subsets. This function
         assumes only one person is in the camera frame during analysis and
-        parses through _joint_candidates and _joint_subsets and assembles them
-        into one dictionary. If a joint was not found in the image, it is
-        mapped to [-1, -1].
-        """
-        if len(self.joint_subsets) > 0:
-            for index, value in enumerate(self._joint_subsets[0]):
-                # Value will be -1 if the joint is not present in the image.
-                if value >= 0:
-                    self._joint_positions[f'{index}'] = [
-                        self._joint_candidates[int(value)][0],
-                        self._joint_candidates[int(value)][1]]
-                else:
-                    self._joint_positions[f"{index}"] = [-1, -1]
-                # After 16, the _joint_subsets variable contains information
-                # about the data and accuracy, but is not useful for mapping
-                # joint positions so it is ignored.
-                if index > 16:
-                    break
+        gathers the joints of the first person into one PoseResult. If a
+        joint was not found in the image, it is at [-1, -1]; if nobody was
+        found, the PoseResult is empty.
+        """
+        self._joint_positions = PoseResult.from_subset(
+            self._joint_candidates, self._joint_subsets)
+
+    @staticmethod
+    def load_reference_joints(joint_paths):
+        """
+        This function reads the joint positions csvs of several masks into
+        one array.
+
+        Args:
+            joint_paths (list): Paths to joint positions csv files.
+        Returns:
+            (numpy.ndarray): A len(joint_paths) x 18 x 2 array of the joint
+                positions of each mask, [-1, -1] where a joint was not found.
+            (numpy.ndarray): A len(joint_paths) x 18 boolean array that is
+                True where a joint was found.
+        """
+        reference_joints = np.full((len(joint_paths), 18, 2), -1.0)
+        for mask, path in enumerate(joint_paths):
+            # Each row holds a joint number and its pixel location, which is
+            # truncated to whole pixels.
+            rows = np.loadtxt(path, delimiter=",", ndmin=2)
+            reference_joints[mask, rows[:, 0].astype(int)] = np.trunc(
+                rows[:, 1:3])
+        reference_valid = np.any(reference_joints != -1, axis=2)
+        return reference_joints, reference_valid
+
+    def score_joints(self, joint_positions, masks=slice(None)):
+        """
+        This function scores how well joint positions fit the reference
+        joints of one or several masks at once, as a percentage. Every joint
+        earns credit based on its distance to the mask's joint; a joint
+        missing from both counts as a perfect match and a joint missing from
+        only one of them earns nothing.
+
+        Args:
+            joint_positions (PoseResult): The user's joint positions.
+            masks (int, list or slice): The rows of _reference_joints to
+                score against. Defaults to every mask.
+        Returns:
+            (numpy.ndarray or float): The score against each selected mask,
+                0 if no user was found.
+        """
+        reference_valid = self._reference_valid[masks]
+        if not joint_positions:
+            return np.zeros(reference_valid.shape[:-1])[()]
+        # Calculates the Euclidian distance (in pixels) between the saved
+        # joint positions and the user's joint positions.
+        distances = np.linalg.norm(
+            self._reference_joints[masks] - joint_positions.xy, axis=-1)
+        fit_credits = self._FIT_CREDITS[
+            np.searchsorted(self._FIT_DISTANCES, distances, side="right")]
+        user_valid = joint_positions.valid
+        fit_credits = np.where(reference_valid & user_valid, fit_credits,
+                               reference_valid == user_valid)
+        return fit_credits.mean(axis=-1) * 100
 
     def compute_accuracy(self, saved_csv_for_mask):
         """
@@ -203,49 +304,22 @@ class HoleInTheCameraGame:
                 joint positions that the user should have matched in order to
                 have had a successful trial.
         """
-        accuracy = 0
-        joint_fits = []
-        joint_counts = 0
-
-        # Reads and stores the saved joint positions to compare against the
-        # user's joint positions.
-        with open(saved_csv_for_mask, "r") as csv_file:
-            csv_reader = csv.reader(csv_file)
-            for row in csv_reader:
-                joint_fits.append(row)
-        for joint in joint_fits:
-            # Ensures that comparisons are only made with joints that are
-            # present.
-            if joint[0] in self._joint_positions.keys() and\
-                    self._joint_positions[joint[0]][1] != '-1':
-                joint_counts += 1
-                reference_joint_position = np.array(
-                    [int(float(joint[1])), int(float(joint[2]))]
-                )
-                user_joint_position = np.array(self._joint_positions[joint[0]])
-                # Calculates the Euclidian distance (in pixels) between the
-                # saved joint positions and the user's joint positions.
-                distance = np.linalg.norm(
-                    reference_joint_position - user_joint_position
-                )
-
-                # Gives users a score based on how well they fit, where a
-                # perfect match (distance is less than 20 pixels) corresponds
-                # to a perfect score.
-                if distance < 30:
-                    accuracy += 1
-                elif distance < 40:
-                    accuracy += 0.5
-                elif distance < 50:
-                    accuracy += 0.25
+        # Masks other than the game's own are read once and kept as well.
+        if saved_csv_for_mask not in self._reference_index:
+            reference_joints, reference_valid = self.load_reference_joints(
+                [saved_csv_for_mask])
+            self._reference_index[saved_csv_for_mask] = len(
+                self._reference_joints)
+            self._reference_joints = np.concatenate(
+                [self._reference_joints, reference_joints])
+            self._reference_valid = np.concatenate(
+                [self._reference_valid, reference_valid])
         # Updates the _total_score and _trial_score variables with the results
         # of this trial.
-        if joint_counts == 0:
-            self._total_score += 0
-            self._trial_score = 0
-        else:
-            self._total_score += accuracy / joint_counts * 100
-            self._trial_score = accuracy / joint_counts * 100
+        self._trial_score = float(self.score_joints(
+            self._joint_positions,
+            self._reference_index[saved_csv_for_mask]))
+        self._total_score += self._trial_score
 
     def check_win(self):
         """
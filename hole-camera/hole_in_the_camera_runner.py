@@ -2,6 +2,7 @@
 Main runner code for hole in the camera game.
 """
 import sys
+from concurrent.futures import wait
 from hole_in_the_camera_controller import OpenCVController
 from hole_in_the_camera_view import PygameViewer
 from hole_in_the_camera_model import HoleInTheCameraGame
@@ -9,6 +10,25 @@ from hole_in_the_camera_model import HoleInTheCameraGame
 # Set up view constants
 CAMERA_INDEX = 0
 DISPLAY_SIZE = (640, 480)
+# Seconds between checks for the pose model while loading
+LOADING_POLL = 0.05
+# Seconds to wait for the final frame's analysis between camera frames
+ANALYSIS_POLL = 0.03
+# Whether to draw the player's live skeleton over the camera view
+SHOW_SKELETON = True
+
+def load_pose_engine():
+    """
+    Start the pose worker process and wait for it to load and warm up the
+    pose model while the loading screen is displayed.
+    """
+    engine = HoleInTheCameraGame.POSE_WORKER.start()
+    game_view.display_loading()
+    # keep handling window events until the model is ready
+    while not engine.wait(LOADING_POLL):
+        if game_controller.next_screen() == "quit":
+            sys.exit()
+
 
 def game_start():
     """
@@ -43,23 +63,50 @@ def run_game():
         hole_mask, joints_file = game_model.get_mask_and_joints()
         game_controller.start_timer()
         current_timer_value = game_controller.get_timer_string()
+        live_pose = None
+        pose = None
         # while loop runs until the timer has expired, signifying the end of
         # the trial
         while True:
             current_frame = game_controller.get_display_frame()
             current_timer_value = game_controller.get_timer_string()
+            if SHOW_SKELETON:
+                # keep one frame in the pose worker and show the latest
+                # skeleton it found
+                if live_pose is not None and live_pose.done():
+                    # a failed preview only hides the skeleton, the round
+                    # goes on
+                    if live_pose.exception() is None:
+                        pose = live_pose.result()
+                    else:
+                        pose = None
+                    live_pose = None
+                if live_pose is None:
+                    try:
+                        live_pose = HoleInTheCameraGame.POSE_WORKER.submit(
+                            current_frame)
+                    except RuntimeError:
+                        pose = None
             # displays the user's frame, along with the hole mask overlaid on
             # top to the user.
             game_view.display_frame(current_frame, current_timer_value,
-                                    hole_mask)
+                                    hole_mask, pose)
             if game_controller.next_screen() == "quit":
                 sys.exit()
             if game_controller.determine_end_timer():
                 final_frame = current_frame
                 break
-        # these functions call the model to analyze the user's final frame and
-        # determine if the user was successful or not.
-        game_model.analyze_frame(final_frame)
+        # the final frame is analyzed in the pose worker process while the
+        # camera view keeps updating.
+        analysis = game_model.analyze_frame_async(final_frame)
+        while not wait([analysis], timeout=ANALYSIS_POLL).done:
+            game_view.display_frame(game_controller.get_display_frame(),
+                                    current_timer_value, hole_mask, pose)
+            if game_controller.next_screen() == "quit":
+                sys.exit()
+        # re-raises any error from the worker
+        analysis.result()
+        # these functions determine if the user was successful or not.
         game_model.parse_for_joint_positions()
         game_model.compute_accuracy(joints_file)
         game_view.display_win(game_model.check_win(), game_model.trial_score)
@@ -103,6 +150,7 @@ if __name__ == "__main__":
     game_model = HoleInTheCameraGame()
     # Start the game and initialize pygame
     game_view.initialize_view()
+    load_pose_engine()
     # Inicia direto no jogo
     current_game_state = "start_screen"  # Apenas para criar pasta fotos
     # Executa até o usuário sair
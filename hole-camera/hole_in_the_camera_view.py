@@ -5,6 +5,7 @@ from abc import ABC, abstractmethod
 import pygame
 from pygame import mixer
 import cv2 as cv
+from deep_pose.skeleton import SkeletonRenderer
 
 
 class HoleInTheWallView(ABC):
@@ -31,6 +32,12 @@ class HoleInTheWallView(ABC):
         Initialize the game view.
         """
 
+    @abstractmethod
+    def display_loading(self):
+        """
+        Display the loading screen shown while the pose model loads.
+        """
+
     @abstractmethod
     def display_introduction(self):
         """
@@ -44,7 +51,7 @@ class HoleInTheWallView(ABC):
         """
 
     @abstractmethod
-    def display_frame(self, frame, timer_text, camera_mask):
+    def display_frame(self, frame, timer_text, camera_mask, pose=None):
         """
         Display the current frame.
 
@@ -52,6 +59,8 @@ class HoleInTheWallView(ABC):
             frame (numpy.ndarray): Current frame to display.
             timer_text (str): Current timer value.
             camera_mask (numpy.ndarray): Current camera mask.
+            pose (tuple): Optional (candidate, subset) of the player's
+                skeleton to draw over the frame.
         """
 
     @abstractmethod
@@ -95,6 +104,8 @@ class PygameViewer(HoleInTheWallView):
         _BACKGROUND_PATHS (list): The paths of the background images.
         _screen (pygame.Surface): The game window.
         _font (pygame.font.SysFont): The font used to display text.
+        _skeleton (SkeletonRenderer): Draws the player's skeleton over the
+            camera frame.
     """
 
     _BLACK = (0, 0, 0)
@@ -127,6 +138,7 @@ class PygameViewer(HoleInTheWallView):
         mixer.init()
         self._screen = pygame.display.set_mode(self._display_size)
         self._font = pygame.font.SysFont(self._FONT_NAME, self._FONT_SIZE)
+        self._skeleton = SkeletonRenderer()
 
     @property
     def screen(self):
@@ -181,6 +193,13 @@ class PygameViewer(HoleInTheWallView):
             y_offset += font_height
         pygame.display.update()
 
+    def display_loading(self):
+        """
+        Display the loading screen shown while the pose model loads.
+        """
+        self._display_background(0)
+        self._display_text(["Carregando..."], self._BLACK, self._WHITE)
+
     def display_introduction(self):
         """
         Display está desabilitado conforme requisito do cliente.
@@ -193,7 +212,7 @@ class PygameViewer(HoleInTheWallView):
         """
         pass
 
-    def display_frame(self, frame, timer_text, camera_mask):
+    def display_frame(self, frame, timer_text, camera_mask, pose=None):
         """
         Display the frame on the game window.
 
@@ -201,8 +220,13 @@ class PygameViewer(HoleInTheWallView):
             frame (numpy.ndarray): The frame to be displayed.
             timer_text (str): The timer text to be displayed.
             mask (numpy.ndarray): The mask to be overlaid on the frame.
+            pose (tuple): Optional (candidate, subset) of the player's
+                skeleton to draw over the frame.
         """
         frame = cv.bitwise_and(frame, camera_mask)
+        if pose is not None:
+            # drawn on the masked copy, so the camera frame is left untouched
+            self._skeleton.draw(frame, *pose)
         frame = pygame.transform.rotate(pygame.surfarray.make_surface(frame),
                                         -90)
         self._screen.blit(frame, (0, 0))
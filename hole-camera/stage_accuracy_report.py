@@ -0,0 +1,116 @@
+"""
+Report how many OpenPose refinement stages are worth running on a deployment.
+Each stage count is used to analyze the pose images of every mask and the
+result is compared against the saved joint positions in mask_joint_positions,
+so operators can trade accuracy for frames per second.
+"""
+import csv
+import time
+import numpy as np
+from deep_pose.body import Body
+from create_csv import MASK_NAMES, analyze_image
+
+# Path to the OpenPose weights.
+MODEL_PATH = "deep_pose/body_pose_model.pth"
+
+# Stage counts to compare, from fastest to the full network.
+STAGE_COUNTS = [1, 2, 3, 4, 5, 6]
+
+# Distance in pixels under which a joint earns full credit in the game.
+FULL_CREDIT_DISTANCE = 30
+
+
+def read_reference_joints(mask_name):
+    """
+    This function reads the saved joint positions of a mask.
+
+    Args:
+        mask_name (str): The name of the mask whose joints should be read.
+    Returns:
+        joint_positions (dict): A dictionary where each key is a string number
+            corresponding to a joint and each value is the pixel location of
+            the joint, [-1, -1] if it was not found.
+    """
+    joint_positions = {}
+    with open(f"mask_joint_positions/{mask_name}.csv", "r") as csv_file:
+        for row in csv.reader(csv_file):
+            joint_positions[row[0]] = [float(row[1]), float(row[2])]
+    return joint_positions
+
+
+def compare_joints(reference, detected):
+    """
+    This function compares detected joint positions against the reference
+    joint positions of the same image.
+
+    Args:
+        reference (dict): The saved joint positions, as returned by
+            read_reference_joints.
+        detected (dict): The joint positions found by OpenPose, as returned
+            by create_csv.analyze_image.
+    Returns:
+        distances (list): The pixel distance of each joint found in both.
+        missing (int): The number of reference joints that were not found.
+    """
+    distances = []
+    missing = 0
+    for joint, position in reference.items():
+        if position[0] < 0:
+            continue
+        if joint not in detected or detected[joint][0] < 0:
+            missing += 1
+            continue
+        distances.append(float(np.linalg.norm(
+            np.array(position) - np.array(detected[joint], dtype=float))))
+    return distances, missing
+
+
+def evaluate_stages(stages):
+    """
+    This function analyzes every mask's pose image with the given number of
+    refinement stages and summarizes its accuracy and speed.
+
+    Args:
+        stages (int): The number of refinement stages to run, from 1 to 6.
+    Returns:
+        (dict): The mean joint error in pixels, the percentage of joints
+            within FULL_CREDIT_DISTANCE, the number of missing joints and the
+            mean time per frame in seconds.
+    """
+    body_estimation = Body(MODEL_PATH, stages=stages)
+    distances = []
+    missing = 0
+    elapsed = 0
+    for mask_name in MASK_NAMES:
+        start = time.perf_counter()
+        detected = analyze_image(mask_name, body_estimation)
+        elapsed += time.perf_counter() - start
+        mask_distances, mask_missing = compare_joints(
+            read_reference_joints(mask_name), detected)
+        distances += mask_distances
+        missing += mask_missing
+    return {
+        "mean_error": np.mean(distances) if distances else float("nan"),
+        "full_credit": 100 * np.mean(
+            np.array(distances) < FULL_CREDIT_DISTANCE) if distances else 0,
+        "missing": missing,
+        "seconds_per_frame": elapsed / len(MASK_NAMES),
+    }
+
+
+def main():
+    """
+    This is the main runner function to print the stage accuracy report.
+    """
+    print(f"{'stages':>6} {'mean err px':>11} {'< 30 px':>8} "
+          f"{'missing':>7} {'ms/frame':>8} {'fps':>6}")
+    for stages in STAGE_COUNTS:
+        result = evaluate_stages(stages)
+        print(f"{stages:>6} {result['mean_error']:>11.1f} "
+              f"{result['full_credit']:>7.1f}% {result['missing']:>7} "
+              f"{1000 * result['seconds_per_frame']:>8.0f} "
+              f"{1 / result['seconds_per_frame']:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@ Test functions for the create_csv.py script.
 
 import os
 import csv
-from create_csv import analyze_image, write_to_csv
+from create_csv import analyze_image, analyze_images, write_to_csv
 
 def test_analyze_image_none():
     """
@@ -39,6 +39,31 @@ def test_analyze_image_values():
             assert False
     assert True
 
+def test_analyze_images_none():
+    """
+    Test that analyze_images returns an empty dictionary of joints for an
+    invalid image name given alongside a correct one.
+    """
+    test_joint_positions = analyze_images(["not_an_image", "first_mask"])
+    assert test_joint_positions["not_an_image"] == {}
+    assert len(test_joint_positions["first_mask"].keys()) == 18
+
+def test_analyze_images_matches_analyze_image():
+    """
+    Test that analyzing images together as a batch finds the same joint
+    positions as analyzing each image on its own.
+    """
+    test_image_names = ["first_mask", "second_mask", "third_mask"]
+    test_joint_positions = analyze_images(test_image_names)
+    for image_name in test_image_names:
+        single_joint_positions = analyze_image(image_name)
+        for key, value in test_joint_positions[image_name].items():
+            # batched and single forward passes may round differently
+            if abs(value[0] - single_joint_positions[key][0]) > 1 or\
+                abs(value[1] - single_joint_positions[key][1]) > 1:
+                assert False
+    assert True
+
 def test_write_to_csv_exists():
     """
     Test that the write_to_csv function correctly creates a csv that is the
@@ -0,0 +1,526 @@
+"""
+Tests for the peak, limb scoring and people assembly helpers in
+deep_pose/body.py. Limb scoring and assembly are checked against the
+per-pair loops they replaced.
+"""
+
+import collections
+import math
+import cv2
+import numpy as np
+from deep_pose.body import (Body, assemble_people, assemble_single,
+                            LimbConnections, connect_limb,
+                            find_peaks_lowres, limit_peaks, lowres_grid,
+                            paf_sampler, part_thresholds)
+
+
+def reference_connect_limb(candA, candB, score_mid, img_height, mid_num=10,
+                           thre2=0.05):
+    """
+    The original loop over every (candA, candB) pair of one limb.
+    """
+    nA = len(candA)
+    nB = len(candB)
+    connection_candidate = []
+    for i in range(nA):
+        for j in range(nB):
+            vec = np.subtract(candB[j][:2], candA[i][:2])
+            norm = math.sqrt(vec[0] * vec[0] + vec[1] * vec[1])
+            norm = max(0.001, norm)
+            vec = np.divide(vec, norm)
+
+            startend = list(zip(
+                np.linspace(candA[i][0], candB[j][0], num=mid_num),
+                np.linspace(candA[i][1], candB[j][1], num=mid_num)))
+
+            vec_x = np.array([score_mid[int(round(startend[I][1])),
+                                        int(round(startend[I][0])), 0]
+                              for I in range(len(startend))])
+            vec_y = np.array([score_mid[int(round(startend[I][1])),
+                                        int(round(startend[I][0])), 1]
+                              for I in range(len(startend))])
+
+            score_midpts = np.multiply(vec_x, vec[0]) +\
+                np.multiply(vec_y, vec[1])
+            score_with_dist_prior = sum(score_midpts) / len(score_midpts) +\
+                min(0.5 * img_height / norm - 1, 0)
+            criterion1 = len(np.nonzero(score_midpts > thre2)[0]) >\
+                0.8 * len(score_midpts)
+            criterion2 = score_with_dist_prior > 0
+            if criterion1 and criterion2:
+                connection_candidate.append(
+                    [i, j, score_with_dist_prior,
+                     score_with_dist_prior + candA[i][2] + candB[j][2]])
+
+    connection_candidate = sorted(connection_candidate, key=lambda x: x[2],
+                                  reverse=True)
+    connection = np.zeros((0, 5))
+    for c in range(len(connection_candidate)):
+        i, j, s = connection_candidate[c][0:3]
+        if i not in connection[:, 3] and j not in connection[:, 4]:
+            connection = np.vstack([connection,
+                                    [candA[i][3], candB[j][3], s, i, j]])
+            if len(connection) >= min(nA, nB):
+                break
+    return connection
+
+
+def random_limb(rng, height=120, width=160):
+    """
+    Random candidates of the two parts of a limb, with peak ids numbered as
+    Body numbers them, and a noisy PAF pointing right so that some pairs
+    pass both criteria and others fail them.
+    """
+    nA, nB = rng.randint(1, 6), rng.randint(1, 6)
+    candA = [(rng.randint(width), rng.randint(height), rng.rand(), n)
+             for n in range(nA)]
+    candB = [(rng.randint(width), rng.randint(height), rng.rand(), nA + n)
+             for n in range(nB)]
+    score_mid = rng.normal(0, 0.5, (height, width, 2))
+    score_mid[:, :, 0] += 0.8
+    return candA, candB, score_mid
+
+
+def test_connect_limb_matches_reference_loop():
+    """
+    Test that scoring every candidate pair of a limb at once gives the same
+    connections, in the same order and with the same scores, as the original
+    per-pair loop, including limbs where no pair connects.
+    """
+    rng = np.random.RandomState(0)
+    connected = 0
+    for _ in range(200):
+        candA, candB, score_mid = random_limb(rng)
+        expected = reference_connect_limb(candA, candB, score_mid, 120)
+        connection = connect_limb(candA, candB, paf_sampler(score_mid), 120)
+        assert connection.shape == expected.shape
+        assert np.array_equal(connection, expected)
+        connected += len(connection) > 0
+    # both limbs that connect and limbs that do not were checked
+    assert 0 < connected < 200
+
+
+def test_connect_limb_uses_each_candidate_once():
+    """
+    Test that two candidates of one part close to the same candidate of the
+    other part are not both connected to it.
+    """
+    score_mid = np.zeros((50, 50, 2))
+    score_mid[:, :, 0] = 1
+    candA = [(5, 20, 0.9, 0), (5, 22, 0.8, 1)]
+    candB = [(30, 21, 0.9, 2)]
+    connection = connect_limb(candA, candB, paf_sampler(score_mid), 50)
+    assert connection.shape == (1, 5)
+    assert list(connection[0, [0, 1, 3, 4]]) == [0, 2, 0, 0]
+
+
+LIMB_SEQUENCE = [[2, 3], [2, 6], [3, 4], [4, 5], [6, 7], [7, 8], [2, 9],
+                 [9, 10], [10, 11], [2, 12], [12, 13], [13, 14], [2, 1],
+                 [1, 15], [15, 17], [1, 16], [16, 18], [3, 17], [6, 18]]
+
+
+def reference_assemble_people(connection_all, special_k, candidate, paths):
+    """
+    The original scan over every subset row, counting in paths how often
+    each of its branches was taken.
+    """
+    subset = -1 * np.ones((0, 20))
+    for k in range(len(LIMB_SEQUENCE)):
+        if k not in special_k:
+            partAs = connection_all[k][:, 0]
+            partBs = connection_all[k][:, 1]
+            indexA, indexB = np.array(LIMB_SEQUENCE[k]) - 1
+
+            for i in range(len(connection_all[k])):
+                found = 0
+                subset_idx = [-1, -1]
+                for j in range(len(subset)):
+                    if subset[j][indexA] == partAs[i] or\
+                            subset[j][indexB] == partBs[i]:
+                        subset_idx[found] = j
+                        found += 1
+
+                if found == 1:
+                    paths["found one"] += 1
+                    j = subset_idx[0]
+                    if subset[j][indexB] != partBs[i]:
+                        subset[j][indexB] = partBs[i]
+                        subset[j][-1] += 1
+                        subset[j][-2] += candidate[partBs[i].astype(int), 2]\
+                            + connection_all[k][i][2]
+                elif found == 2:
+                    j1, j2 = subset_idx
+                    membership = ((subset[j1] >= 0).astype(int) +
+                                  (subset[j2] >= 0).astype(int))[:-2]
+                    if len(np.nonzero(membership == 2)[0]) == 0:
+                        paths["merge"] += 1
+                        subset[j1][:-2] += (subset[j2][:-2] + 1)
+                        subset[j1][-2:] += subset[j2][-2:]
+                        subset[j1][-2] += connection_all[k][i][2]
+                        subset = np.delete(subset, j2, 0)
+                    else:
+                        paths["found two"] += 1
+                        subset[j1][indexB] = partBs[i]
+                        subset[j1][-1] += 1
+                        subset[j1][-2] += candidate[partBs[i].astype(int), 2]\
+                            + connection_all[k][i][2]
+                elif not found and k < 17:
+                    paths["new row"] += 1
+                    row = -1 * np.ones(20)
+                    row[indexA] = partAs[i]
+                    row[indexB] = partBs[i]
+                    row[-1] = 2
+                    row[-2] = sum(candidate[connection_all[k][i, :2]
+                                            .astype(int), 2]) +\
+                        connection_all[k][i][2]
+                    subset = np.vstack([subset, row])
+    deleteIdx = []
+    for i in range(len(subset)):
+        if subset[i][-1] < 4 or subset[i][-2] / subset[i][-1] < 0.4:
+            deleteIdx.append(i)
+    return np.delete(subset, deleteIdx, axis=0)
+
+
+def random_connections(rng):
+    """
+    Random peaks of every part and, for each limb, connections that use
+    every peak at most once, as connect_limb returns them.
+    """
+    all_peaks = []
+    peak_counter = 0
+    for _ in range(18):
+        count = rng.randint(0, 4)
+        all_peaks.append([(0, 0, rng.rand(), peak_counter + n)
+                          for n in range(count)])
+        peak_counter += count
+    candidate = np.array([peak for peaks in all_peaks for peak in peaks])
+    connection_all = []
+    special_k = []
+    for k, (partA, partB) in enumerate(LIMB_SEQUENCE):
+        candA, candB = all_peaks[partA - 1], all_peaks[partB - 1]
+        if len(candA) == 0 or len(candB) == 0:
+            special_k.append(k)
+            connection_all.append([])
+            continue
+        count = rng.randint(0, min(len(candA), len(candB)) + 1)
+        rows = [[candA[i][3], candB[j][3], rng.rand(), i, j]
+                for i, j in zip(rng.permutation(len(candA))[:count],
+                                rng.permutation(len(candB))[:count])]
+        connection_all.append(np.array(rows).reshape(-1, 5))
+    return connection_all, special_k, candidate
+
+
+def hand_connections(connections, count):
+    """
+    connection_all and special_k for the (peak A, peak B) pairs listed per
+    limb in connections, every limb scoring 0.5, and a candidate array of
+    count peaks scoring 0.9.
+    """
+    connection_all = []
+    special_k = []
+    for k in range(len(LIMB_SEQUENCE)):
+        if k not in connections:
+            special_k.append(k)
+            connection_all.append([])
+            continue
+        connection_all.append(np.array(
+            [[partA, partB, 0.5, 0, 0] for partA, partB in connections[k]]))
+    candidate = np.array([[0, 0, 0.9, n] for n in range(count)])
+    return connection_all, special_k, candidate
+
+
+def test_assemble_people_matches_reference_loop():
+    """
+    Test that assembling random connections into people gives the same
+    subsets, row for row, as the original scan, and that the random cases
+    take every branch of it: extending a person, merging two people, adding
+    to one of two overlapping people and starting a new person.
+    """
+    rng = np.random.RandomState(0)
+    paths = collections.Counter()
+    for _ in range(300):
+        connection_all, special_k, candidate = random_connections(rng)
+        expected = reference_assemble_people(connection_all, special_k,
+                                             candidate, paths)
+        subset = assemble_people(connection_all, special_k, candidate,
+                                 LIMB_SEQUENCE)
+        assert subset.shape == expected.shape
+        assert np.array_equal(subset, expected)
+    for path in ["found one", "merge", "found two", "new row"]:
+        assert paths[path] > 0
+
+
+def test_assemble_people_merges_disjoint_people():
+    """
+    Test that a body (neck 0, shoulders 1 and 3, elbow 2) and a head found
+    apart from it (nose 4, eye 5, ear 6) become one person when the shoulder
+    to ear limb joins them, with the parts and scores of both.
+    """
+    connection_all, special_k, candidate = hand_connections(
+        {0: [(0, 1)], 1: [(0, 3)], 2: [(1, 2)], 13: [(4, 5)], 14: [(5, 6)],
+         17: [(1, 6)]}, 7)
+    paths = collections.Counter()
+    expected = reference_assemble_people(connection_all, special_k, candidate,
+                                         paths)
+    subset = assemble_people(connection_all, special_k, candidate,
+                             LIMB_SEQUENCE)
+    assert paths["merge"] == 1
+    assert np.array_equal(subset, expected)
+    assert subset.shape == (1, 20)
+    assert list(subset[0, [0, 1, 2, 3, 5, 14, 16]]) == [4, 0, 1, 2, 3, 5, 6]
+    assert subset[0, -1] == 7
+    assert np.isclose(subset[0, -2], 7 * 0.9 + 6 * 0.5)
+
+
+def test_assemble_people_keeps_overlapping_people_apart():
+    """
+    Test that when the shoulder to ear limb joins the body to a head that
+    has its own neck (7), the two are not merged: the ear is added to the
+    body and the head stays a separate person.
+    """
+    connection_all, special_k, candidate = hand_connections(
+        {0: [(0, 1)], 1: [(0, 3)], 2: [(1, 2)], 12: [(7, 4)], 13: [(4, 5)],
+         14: [(5, 6)], 17: [(1, 6)]}, 8)
+    paths = collections.Counter()
+    expected = reference_assemble_people(connection_all, special_k, candidate,
+                                         paths)
+    subset = assemble_people(connection_all, special_k, candidate,
+                             LIMB_SEQUENCE)
+    assert paths["found two"] == 1
+    assert np.array_equal(subset, expected)
+    assert subset.shape == (2, 20)
+    assert list(subset[0, [1, 2, 3, 5, 16]]) == [0, 1, 2, 3, 6]
+    assert list(subset[1, [0, 1, 14, 16]]) == [4, 7, 5, 6]
+    assert list(subset[:, -1]) == [5, 4]
+
+
+def test_part_thresholds():
+    """
+    Test that every part uses the fixed threshold without sigmas, and that
+    with sigmas only a noisy heatmap gets a higher threshold, of its mean
+    plus sigmas standard deviations.
+    """
+    rng = np.random.RandomState(0)
+    heatmaps = np.zeros((18, 60, 80), np.float32)
+    heatmaps[3] = rng.uniform(0, 0.6, (60, 80))
+    assert part_thresholds(heatmaps, 0.1).tolist() == [0.1] * 18
+    thresholds = part_thresholds(heatmaps, 0.1, 2.0)
+    noisy = heatmaps[3].astype(np.float64)
+    assert np.isclose(thresholds[3], noisy.mean() + 2.0 * noisy.std())
+    assert thresholds[3] > 0.1
+    assert np.delete(thresholds, 3).tolist() == [0.1] * 17
+
+
+def test_limit_peaks():
+    """
+    Test that only the highest-scoring peaks of each part are kept, in their
+    original order, with ids renumbered to stay consecutive, and that the
+    number of dropped peaks is returned.
+    """
+    all_peaks = [[(1, 1, 0.2, 0), (2, 2, 0.9, 1), (3, 3, 0.5, 2)],
+                 [],
+                 [(4, 4, 0.3, 3), (5, 5, 0.4, 4)]]
+    limited, dropped = limit_peaks(all_peaks, 2)
+    assert limited == [[(2, 2, 0.9, 0), (3, 3, 0.5, 1)],
+                       [],
+                       [(4, 4, 0.3, 2), (5, 5, 0.4, 3)]]
+    assert dropped == 1
+    assert limit_peaks(all_peaks, 3) == (all_peaks, 0)
+
+
+def test_find_peaks_lowres():
+    """
+    Test that peaks on the stride-resolution heatmap are refined to sub-pixel
+    accuracy and mapped to image coordinates, that peaks in the padding
+    outside the image and peaks below the threshold are dropped, and that the
+    peaks kept are numbered in part order.
+    """
+    heatmap = np.zeros((19, 10, 12), np.float32)
+    # a parabola through (3, 0.5), (4, 1.0), (5, 0.75) peaks at x = 4 + 1/6
+    heatmap[0, 3, 3:6] = [0.5, 1.0, 0.75]
+    heatmap[0, [2, 4], 4] = 0.5
+    # column 11 of the grid maps beyond the 80 pixel wide image
+    heatmap[1, 2, 11] = 0.9
+    heatmap[2, 5, 5] = 0.05
+    heatmap[3, 1, 1] = 0.8
+    heatmap[3, 7, 7] = 0.6
+
+    def to_image(x, y):
+        return (x + 0.5) * 8 - 0.5, (y + 0.5) * 8 - 0.5
+
+    all_peaks = find_peaks_lowres(heatmap, 0.1, to_image, (72, 80, 3))
+    assert len(all_peaks) == 18
+    (x, y, score, peak_id), = all_peaks[0]
+    assert np.isclose(x, (4 + 1 / 6 + 0.5) * 8 - 0.5)
+    assert np.isclose(y, 27.5)
+    assert (score, peak_id) == (1.0, 0)
+    assert all_peaks[1] == [] and all_peaks[2] == []
+    assert [peak[:2] for peak in all_peaks[3]] == [(11.5, 11.5), (59.5, 59.5)]
+    assert [peak[3] for peak in all_peaks[3]] == [1, 2]
+    assert all(peaks == [] for peaks in all_peaks[4:])
+
+
+def test_lowres_grid_aligns_scales_with_different_padding():
+    """
+    Test that a part seen at two scales, one of whose outputs carries extra
+    padding cells, lands on the same cell of the first scale's valid grid
+    and maps back to the same image location.
+    """
+    # a 64 x 64 frame at scale 0.5, in a batch padded to 48 x 48 pixels
+    small = np.zeros((1, 19, 6, 6), np.float32)
+    small[0, 0, 1, 2] = 1
+    # and at scale 1, where the part covers 2 x 2 cells
+    large = np.zeros((1, 19, 8, 8), np.float32)
+    large[0, 0, 2:4, 4:6] = 1
+    heatmap = lowres_grid(small, (32, 32), 8)
+    assert heatmap.shape == (19, 4, 4)
+    heatmap = (heatmap + lowres_grid(large, (64, 64), 8, (4, 4))) / 2
+    assert np.unravel_index(heatmap[0].argmax(), (4, 4)) == (1, 2)
+    assert np.isclose(heatmap[0, 1, 2], 1)
+
+    def to_image(x, y):
+        return (x + 0.5) * 16 - 0.5, (y + 0.5) * 16 - 0.5
+
+    all_peaks = find_peaks_lowres(heatmap, 0.1, to_image, (64, 64, 3))
+    assert [peak[:2] for peak in all_peaks[0]] == [(39.5, 23.5)]
+
+
+def single_person(groups, peak_score=0.9, limb_score=0.5):
+    """
+    The top peak of every part, and the connections of the limbs joining the
+    parts of each group in groups, given as lists of limbs.
+    """
+    all_peaks = [[(10 * part, 20, peak_score, part)] for part in range(18)]
+    connection_all = [np.zeros((0, 5)) for _ in LIMB_SEQUENCE]
+    for limbs in groups:
+        for limb in limbs:
+            k = LIMB_SEQUENCE.index(limb)
+            indexA, indexB = np.array(limb) - 1
+            connection_all[k] = np.array([[indexA, indexB, limb_score, 0, 0]])
+    return all_peaks, connection_all
+
+
+def test_assemble_single_keeps_largest_group():
+    """
+    Test that of two groups of joined parts only the one with the most parts
+    is kept, scored with its peaks and limbs.
+    """
+    arm = [[2, 3], [3, 4], [4, 5]]
+    leg = [[9, 10], [10, 11]]
+    subset = assemble_single(*single_person([leg, arm]), LIMB_SEQUENCE)
+    assert subset.shape == (1, 20)
+    assert list(np.nonzero(subset[0, :18] >= 0)[0]) == [1, 2, 3, 4]
+    assert list(subset[0, 1:5]) == [1, 2, 3, 4]
+    assert subset[0, -1] == 4
+    assert np.isclose(subset[0, -2], 4 * 0.9 + 3 * 0.5)
+
+
+def test_assemble_single_scores_cycle_limbs_like_assemble_people():
+    """
+    Test that a limb closing a cycle adds no score and that an ear-shoulder
+    limb does not pull in a shoulder outside the person, so that a
+    borderline person is kept or dropped as assemble_people would.
+    """
+    face = [[2, 1], [1, 15], [15, 17]]
+    cases = [
+        # the right shoulder closes the neck-nose-eye-ear-shoulder cycle
+        ([face + [[2, 3], [3, 17]]], 0.1, 0.35),
+        ([face + [[2, 3], [3, 17]]], 0.2, 0.35),
+        # the right shoulder is only reached through its ear
+        ([face + [[1, 16], [3, 17]]], 0.2, 0.45),
+    ]
+    for groups, peak_score, limb_score in cases:
+        all_peaks, connection_all = single_person(groups, peak_score,
+                                                  limb_score)
+        candidate = np.array([peaks[0] for peaks in all_peaks])
+        expected = assemble_people(connection_all, [], candidate,
+                                   LIMB_SEQUENCE)
+        subset = assemble_single(all_peaks, connection_all, LIMB_SEQUENCE)
+        assert subset.shape == expected.shape
+        if len(expected) > 0:
+            assert np.array_equal(subset[0, :18], expected[0, :18])
+            assert np.isclose(subset[0, -2], expected[0, -2])
+            assert subset[0, -1] == expected[0, -1]
+
+
+def test_assemble_single_scores_only_limbs_it_needs():
+    """
+    Test that with limbs scored on demand, assemble_single asks for every
+    limb of the tree but only for the ear-shoulder limbs that can still
+    extend the person, and gives the same row as with every limb scored.
+    """
+    groups = [[[2, 3], [2, 6], [2, 1], [1, 15], [15, 17], [1, 16]]]
+    all_peaks, connection_all = single_person(groups)
+    scored = []
+
+    def connect(k):
+        scored.append(k)
+        return connection_all[k]
+
+    subset = assemble_single(all_peaks, LimbConnections(connect),
+                             LIMB_SEQUENCE)
+    # [3, 17] joins two parts of the person, [6, 18] could add the left ear
+    assert sorted(scored) == list(range(17)) + [18]
+    assert np.array_equal(subset, assemble_single(all_peaks, connection_all,
+                                                  LIMB_SEQUENCE))
+
+
+def test_assemble_single_filters_like_assemble_people():
+    """
+    Test that the single person is dropped when it has fewer than 4 parts or
+    its score per part is below 0.4, and that no limbs give nobody.
+    """
+    assert len(assemble_single(*single_person([[[2, 3], [3, 4]]]),
+                               LIMB_SEQUENCE)) == 0
+    arm = [[2, 3], [3, 4], [4, 5]]
+    weak = single_person([arm], peak_score=0.1, limb_score=0.1)
+    assert len(assemble_single(*weak, LIMB_SEQUENCE)) == 0
+    assert len(assemble_single(*single_person([]), LIMB_SEQUENCE)) == 0
+    assert len(assemble_single(*single_person([arm]), LIMB_SEQUENCE)) == 1
+
+
+def test_body_counters_count_every_batch_frame():
+    """
+    Test that Body.counters counts every frame of a batch, which is
+    post-processed on several threads, and that with one peak per part the
+    frames with dropped peaks are counted too.
+    """
+    body_estimation = Body("deep_pose/body_pose_model.pth", max_peaks=1)
+    frame = cv2.imread("images/poses/first_mask.png")
+    # two players side by side, so parts have more than one peak
+    frame = cv2.resize(np.concatenate([frame, frame], axis=1), (640, 480))
+    body_estimation.batch([frame] * 8, workers=4)
+    assert body_estimation.counters["frames"] == 8
+    assert body_estimation.counters["peak_limited_frames"] == 8
+    assert body_estimation.counters["dropped_peaks"] >= 8
+
+
+def test_body_batch_profiles_every_frame():
+    """
+    Test that Body.batch records a total for every frame it post-processes
+    on its threads, alongside the stages of that post-processing.
+    """
+    body_estimation = Body("deep_pose/body_pose_model.pth", profile=True)
+    frame = cv2.resize(cv2.imread("images/poses/first_mask.png"), (320, 240))
+    body_estimation.batch([frame] * 8, workers=4)
+    stats = body_estimation.stats()
+    assert stats["total"]["count"] == 8
+    assert stats["peaks"]["count"] == 8
+
+
+def test_lean_body_keeps_buffers_of_recent_sizes_only():
+    """
+    Test that lean Body gives the same poses as Body, and that of frames of
+    several sizes it only keeps the buffers of the most recent ones.
+    """
+    body_estimation = Body("deep_pose/body_pose_model.pth")
+    lean_estimation = Body("deep_pose/body_pose_model.pth", lean=True)
+    frame = cv2.imread("images/poses/first_mask.png")
+    for height, width in [(480, 640), (384, 320), (256, 192), (480, 640)]:
+        resized = cv2.resize(frame, (width, height))
+        candidate, subset = body_estimation(resized)
+        lean_candidate, lean_subset = lean_estimation(resized)
+        assert np.array_equal(lean_candidate, candidate)
+        assert np.array_equal(lean_subset, subset)
+    assert list(lean_estimation._work.buffers) == [(256, 192), (480, 640)]
+    assert list(lean_estimation._buffers) == [(256, 192), (480, 640)]
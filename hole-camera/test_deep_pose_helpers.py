@@ -0,0 +1,276 @@
+"""
+Tests for the wrappers in deep_pose that sit in front of a pose estimator,
+driven by a stub estimator instead of the network.
+"""
+
+import cv2
+import numpy as np
+from deep_pose.motion_gate import MotionGate
+from deep_pose.roi import RoiBody
+from deep_pose.tracker import (KeypointTracker, OneEuroFilter,
+                               person_with_most_joints)
+
+
+def person(joints):
+    """
+    The (candidate, subset) a pose estimator returns for one person whose
+    joints are given as a dictionary from joint number to pixel location.
+    """
+    candidate = np.array([[x, y, 0.9, n]
+                          for n, (x, y) in enumerate(joints.values())])
+    subset = -1 * np.ones((1, 20))
+    for n, part in enumerate(joints):
+        subset[0, part] = n
+    subset[0, 18] = 0.9 * len(joints)
+    subset[0, 19] = len(joints)
+    return candidate, subset
+
+
+NOBODY = (np.zeros((0, 4)), -1 * np.ones((0, 20)))
+
+
+class StubEstimator:
+    """
+    Pose estimator that returns the given results in turn, repeating the
+    last one, and remembers the frames it was called with.
+    """
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.frames = []
+
+    def __call__(self, frame):
+        self.frames.append(frame)
+        return self.results[min(len(self.frames), len(self.results)) - 1]
+
+
+def test_motion_gate_reuses_pose_of_static_frames():
+    """
+    Test that the pose estimator runs once for a frame shown three times, and
+    that the later calls return the pose it found.
+    """
+    estimator = StubEstimator(person({0: (10, 20)}))
+    gate = MotionGate(estimator)
+    frame = np.full((480, 640, 3), 100, np.uint8)
+    results = [gate(frame) for _ in range(3)]
+    assert len(estimator.frames) == 1
+    assert all(result is results[0] for result in results)
+    assert gate.stats() == {"hits": 2, "misses": 1, "hit_rate": 2 / 3}
+
+
+def test_motion_gate_threshold():
+    """
+    Test that a frame whose gray levels differ from the analyzed one by
+    exactly the threshold counts as unchanged, and one that differs by more
+    runs the pose estimator again.
+    """
+    estimator = StubEstimator(person({0: (10, 20)}))
+    gate = MotionGate(estimator, threshold=3.0)
+    gate(np.full((480, 640, 3), 100, np.uint8))
+    gate(np.full((480, 640, 3), 103, np.uint8))
+    assert len(estimator.frames) == 1
+    gate(np.full((480, 640, 3), 104, np.uint8))
+    assert len(estimator.frames) == 2
+    assert (gate.hits, gate.misses) == (1, 2)
+
+
+def test_motion_gate_compares_with_last_analyzed_frame():
+    """
+    Test that small changes add up: frames that each differ from the previous
+    one by less than the threshold run the pose estimator again once they
+    differ from the last analyzed frame by more than it.
+    """
+    estimator = StubEstimator(person({0: (10, 20)}))
+    gate = MotionGate(estimator, threshold=3.0)
+    for level in [100, 102, 104, 106]:
+        gate(np.full((480, 640, 3), level, np.uint8))
+    assert [frame[0, 0, 0] for frame in estimator.frames] == [100, 104]
+
+
+def test_motion_gate_reset():
+    """
+    Test that after reset the pose estimator runs even for an unchanged frame.
+    """
+    estimator = StubEstimator(person({0: (10, 20)}))
+    gate = MotionGate(estimator)
+    frame = np.zeros((480, 640, 3), np.uint8)
+    gate(frame)
+    gate.reset()
+    gate(frame)
+    assert len(estimator.frames) == 2
+    assert gate.hit_rate() == 0.0
+
+
+def textured_frame():
+    """
+    A frame with enough texture everywhere for optical flow to follow it.
+    """
+    rng = np.random.RandomState(0)
+    noise = rng.randint(0, 256, (480, 640)).astype(np.uint8)
+    gray = cv2.GaussianBlur(noise, (0, 0), 3)
+    return cv2.cvtColor(cv2.normalize(gray, None, 0, 255, cv2.NORM_MINMAX),
+                        cv2.COLOR_GRAY2BGR)
+
+
+def test_person_with_most_joints():
+    """
+    Test that the joints of the person with the most parts are returned, with
+    NaN for the joints that person is missing.
+    """
+    candidate, subset = person({0: (10, 20), 1: (30, 40)})
+    other_candidate, other_subset = person({0: (50, 60), 1: (70, 80),
+                                            2: (90, 100)})
+    other_subset[0, :18][other_subset[0, :18] >= 0] += len(candidate)
+    joints = person_with_most_joints(
+        np.concatenate([candidate, other_candidate]),
+        np.concatenate([subset, other_subset]))
+    assert joints.shape == (18, 2)
+    assert joints[:3].tolist() == [[50, 60], [70, 80], [90, 100]]
+    assert np.isnan(joints[3:]).all()
+    assert np.isnan(person_with_most_joints(*NOBODY)).all()
+
+
+def test_one_euro_filter_smooths_jitter():
+    """
+    Test that the filter returns its first input unchanged and then pulls
+    a small jump only part of the way towards the new value.
+    """
+    smoothing = OneEuroFilter()
+    assert smoothing(np.array([[100, 100]]), 0.0).tolist() == [[100, 100]]
+    smoothed = smoothing(np.array([[102, 100]]), 1 / 30)
+    assert 100 < smoothed[0, 0] < 102
+    assert smoothed[0, 1] == 100
+
+
+def test_one_euro_filter_restarts_after_nan():
+    """
+    Test that a coordinate that goes missing is passed through as NaN, and
+    that when it comes back the filter restarts from the new value instead
+    of smoothing from where it was before.
+    """
+    smoothing = OneEuroFilter()
+    smoothing(np.array([[100, 100]]), 0.0)
+    assert np.isnan(smoothing(np.array([[np.nan, np.nan]]), 1 / 30)).all()
+    restarted = smoothing(np.array([[300, 200]]), 2 / 30)
+    assert np.allclose(restarted, [[300, 200]])
+
+
+def test_keypoint_tracker_runs_estimator_every_interval():
+    """
+    Test that the tracker runs the pose estimator on the first frame and then
+    every interval frames, and follows the joints of a static frame with
+    optical flow in between.
+    """
+    estimator = StubEstimator(person({0: (200, 150), 1: (320, 240)}))
+    tracker = KeypointTracker(estimator, interval=3)
+    frame = textured_frame()
+    for n in range(7):
+        joints = tracker(frame, timestamp=n / 30)
+    assert len(estimator.frames) == 3
+    assert tracker.stats()["inferences"] == 3
+    assert tracker.stats()["tracked_frames"] == 4
+    assert np.allclose(joints[:2], [[200, 150], [320, 240]], atol=0.5)
+    assert np.isnan(joints[2:]).all()
+
+
+def test_keypoint_tracker_runs_estimator_when_confidence_drops():
+    """
+    Test that the pose estimator runs again before the interval is over when
+    the share of joints still tracked falls below min_confidence: of two
+    joints, the one on a flat part of the frame cannot be followed.
+    """
+    estimator = StubEstimator(person({0: (200, 150), 1: (520, 240)}))
+    tracker = KeypointTracker(estimator, interval=10, min_confidence=0.6)
+    frame = textured_frame()
+    frame[:, 400:] = 128
+    joints = tracker(frame, timestamp=0.0)
+    joints = tracker(frame, timestamp=1 / 30)
+    assert tracker.confidence == 0.5
+    assert np.isnan(joints[1]).all()
+    tracker(frame, timestamp=2 / 30)
+    assert tracker.stats()["inferences"] == 2
+    assert tracker.stats()["tracked_frames"] == 1
+
+
+def test_keypoint_tracker_reset():
+    """
+    Test that after reset the next frame runs the pose estimator again.
+    """
+    estimator = StubEstimator(person({0: (200, 150)}))
+    tracker = KeypointTracker(estimator, interval=10)
+    frame = textured_frame()
+    tracker(frame, timestamp=0.0)
+    tracker.reset()
+    tracker(frame, timestamp=1 / 30)
+    assert len(estimator.frames) == 2
+
+
+def test_roi_body_crop_for():
+    """
+    Test that the crop around a player's joints is grown by the margin, made
+    at least min_aspect times its height wide and snapped outwards to
+    multiples of step pixels.
+    """
+    roi = RoiBody(StubEstimator(NOBODY))
+    joints = np.full((18, 2), np.nan, np.float32)
+    joints[0] = (100, 200)
+    joints[1] = (140, 300)
+    # 100 pixels tall grows by 30 on both sides to 160, so the crop must be
+    # 120 wide: 40 pixels on both sides of the 40 pixel wide joints
+    assert roi.crop_for(joints, (480, 640, 3)) == (32, 160, 192, 352)
+
+
+def test_roi_body_crop_for_frame_edges_and_no_joints():
+    """
+    Test that the crop stays inside the frame and that there is no crop when
+    no joint was found.
+    """
+    roi = RoiBody(StubEstimator(NOBODY))
+    joints = np.full((18, 2), np.nan, np.float32)
+    assert roi.crop_for(joints, (480, 640, 3)) is None
+    joints[0] = (10, 20)
+    joints[1] = (630, 470)
+    assert roi.crop_for(joints, (480, 640, 3)) == (0, 0, 640, 480)
+
+
+def test_roi_body_offsets_joints_back_to_frame():
+    """
+    Test that after a player is found in the whole frame, the next frame is
+    analyzed on the crop around them and the joints found in the crop are
+    moved back to frame coordinates.
+    """
+    found = person({0: (100, 200), 1: (140, 300)})
+    in_crop = person({0: (70, 40), 1: (110, 140)})
+    estimator = StubEstimator(found, in_crop)
+    roi = RoiBody(estimator)
+    frame = np.zeros((480, 640, 3), np.uint8)
+    roi(frame)
+    candidate, subset = roi(frame)
+    assert estimator.frames[1].shape == (192, 160, 3)
+    assert candidate[:, :2].tolist() == [[102, 200], [142, 300]]
+    assert np.array_equal(subset, in_crop[1])
+    assert roi.stats() == {"roi_calls": 1, "full_calls": 1,
+                           "roi": (32, 160, 192, 352)}
+
+
+def test_roi_body_falls_back_to_whole_frame():
+    """
+    Test that the whole frame is analyzed again in the same call when the
+    crop shows nobody, and every refresh calls otherwise.
+    """
+    found = person({0: (100, 200), 1: (140, 300)})
+    estimator = StubEstimator(found, NOBODY, found)
+    roi = RoiBody(estimator)
+    frame = np.zeros((480, 640, 3), np.uint8)
+    roi(frame)
+    roi(frame)
+    assert [analyzed.shape for analyzed in estimator.frames] ==\
+        [(480, 640, 3), (192, 160, 3), (480, 640, 3)]
+    assert roi.stats()["full_calls"] == 2
+
+    estimator = StubEstimator(found)
+    roi = RoiBody(estimator, refresh=2)
+    for _ in range(4):
+        roi(frame)
+    assert [analyzed.shape == frame.shape for analyzed in estimator.frames]\
+        == [True, False, False, True]
@@ -0,0 +1,50 @@
+"""
+Tests for the changes deep_pose/model.py makes to the body model, run on a
+small model with random weights.
+"""
+
+import copy
+import torch
+from deep_pose.model import bodypose_model, fold_input_normalization
+
+
+def random_model():
+    """
+    A two-stage body model with random weights and a random frame of pixel
+    values for it.
+    """
+    torch.manual_seed(0)
+    model = bodypose_model(stages=2).eval()
+    frame = torch.randint(0, 256, (1, 3, 64, 80)).float()
+    return model, frame
+
+
+def test_fold_input_normalization_matches_normalized_input():
+    """
+    Test that the model with the normalization folded into its first layer
+    gives on raw pixel values what the original model gives on the
+    normalized frame, including at the frame borders.
+    """
+    model, frame = random_model()
+    folded = fold_input_normalization(copy.deepcopy(model))
+    with torch.no_grad():
+        expected_paf, expected_heatmap = model(frame / 256 - 0.5)
+        paf, heatmap = folded(frame)
+    assert paf.shape == expected_paf.shape
+    assert heatmap.shape == expected_heatmap.shape
+    assert torch.allclose(paf, expected_paf, atol=1e-6)
+    assert torch.allclose(heatmap, expected_heatmap, atol=1e-6)
+
+
+def test_heatmap_only_skips_paf_branch():
+    """
+    Test that with heatmap_only set the model returns None in place of the
+    PAF output and the same heatmap as the full model.
+    """
+    model, frame = random_model()
+    with torch.no_grad():
+        _, expected_heatmap = model(frame)
+        model.heatmap_only = True
+        paf, heatmap = model(frame)
+    assert paf is None
+    assert torch.equal(heatmap, expected_heatmap)
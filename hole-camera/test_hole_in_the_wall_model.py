@@ -5,6 +5,7 @@ Tests for the HoleInTheCameraGame class
 import os
 import cv2
 import numpy as np
+from deep_pose.worker import PoseWorker
 from hole_in_the_camera_model import HoleInTheCameraGame
 
 
@@ -130,6 +131,92 @@ def test_analyze_frame_black_image_joint_candidates():
     assert len(test_model.joint_candidates) == 0
 
 
+def test_analyze_frame_records_stage_timings():
+    """
+    Tests that analyzing a frame records a timing for every stage of pose
+    estimation in the profiler of BODY_ESTIMATION.
+    """
+    test_model = HoleInTheCameraGame()
+    test_image = cv2.imread("images/poses/first_mask.png")
+    test_model.analyze_frame(test_image)
+    stats = HoleInTheCameraGame.BODY_ESTIMATION.stats()
+    for stage in ["resize", "forward", "upsample", "peaks", "paf",
+                  "assembly", "total"]:
+        assert stats[stage]["count"] >= 1
+    assert stats["total"]["p50"] >= stats["forward"]["p50"]
+
+
+def test_analyze_frame_loads_shared_engine():
+    """
+    Tests that the pose engine is shared with create_csv and is loaded once a
+    frame has been analyzed.
+    """
+    from create_csv import BODY_ESTIMATION
+    test_model = HoleInTheCameraGame()
+    test_model.analyze_frame(np.zeros([480, 640, 3], np.uint8))
+    assert HoleInTheCameraGame.BODY_ESTIMATION is BODY_ESTIMATION
+    assert HoleInTheCameraGame.BODY_ESTIMATION.ready()
+
+
+def test_analyze_frame_async_matches_analyze_frame():
+    """
+    Tests that analyzing a frame in the pose worker process stores the same
+    joints as analyzing it directly.
+    """
+    test_model = HoleInTheCameraGame()
+    test_image = cv2.imread("images/poses/first_mask.png")
+    test_model.analyze_frame(test_image)
+    expected_candidates = test_model.joint_candidates
+    expected_subsets = test_model.joint_subsets
+    test_model.analyze_frame_async(test_image).result()
+    assert np.array_equal(test_model.joint_candidates, expected_candidates)
+    assert np.array_equal(test_model.joint_subsets, expected_subsets)
+
+
+def test_analyze_frame_async_after_worker_restart():
+    """
+    Tests that the pose worker process can be closed and started again, and
+    that frames submitted after the restart are still analyzed.
+    """
+    test_model = HoleInTheCameraGame()
+    test_image = cv2.imread("images/poses/first_mask.png")
+    test_model.analyze_frame_async(test_image).result(timeout=120)
+    HoleInTheCameraGame.POSE_WORKER.close()
+    test_model.analyze_frame_async(test_image).result(timeout=120)
+    assert len(test_model.joint_subsets) == 1
+
+
+def test_pose_worker_ready_when_process_dies_while_loading():
+    """
+    Tests that waiting for a pose worker whose process dies before it has
+    loaded the model returns instead of waiting forever, and that frames
+    submitted to it are refused with a RuntimeError.
+    """
+    worker = PoseWorker("deep_pose/body_pose_model.pth").start()
+    worker._process.kill()
+    assert worker.wait(timeout=10)
+    try:
+        worker.submit(np.zeros([480, 640, 3], np.uint8))
+        refused = False
+    except RuntimeError:
+        refused = True
+    worker.close()
+    assert refused
+
+
+def test_pose_worker_fails_pending_frames_when_process_dies():
+    """
+    Tests that a frame still being analyzed when the pose worker process dies
+    raises a RuntimeError instead of never being resolved.
+    """
+    worker = PoseWorker("deep_pose/body_pose_model.pth")
+    worker.wait()
+    analysis = worker.submit(np.zeros([480, 640, 3], np.uint8))
+    worker._process.kill()
+    assert isinstance(analysis.exception(timeout=10), RuntimeError)
+    worker.close()
+
+
 def test_analyze_frame_black_image_joint_subsets():
     """
     Tests that deep pose does not return any joint subsets
@@ -410,6 +497,24 @@ def test_parse_for_joint_positions_other_half_upper_found_joint_positions():
                 assert False
     assert True
 
+def test_parse_for_joint_positions_arrays_match_positions():
+    """
+    Test that the joint position arrays stored by parse_for_joint_positions
+    agree with the joint positions read by joint number: 18 float32 joints,
+    valid exactly where a position other than [-1, -1] was found.
+    """
+    test_model = HoleInTheCameraGame()
+    test_image = cv2.imread("images/poses/first_mask.png")
+    test_model.analyze_frame(test_image)
+    test_model.parse_for_joint_positions()
+    joint_positions = test_model.joint_positions
+    assert joint_positions.keypoints.shape == (18, 3)
+    assert joint_positions.keypoints.dtype == np.float32
+    for key, value in joint_positions.items():
+        assert joint_positions.valid[int(key)] == (value != [-1, -1])
+        assert list(joint_positions.xy[int(key)]) == value
+
+
 def test_compute_accuracy_white_image_total_score():
     """
     Test that the computed fit accuracy is 0 when a white image is analyzed and
@@ -502,6 +607,26 @@ def test_compute_accuracy_same_image_trial_score_three_trials():
     assert test_model.trial_score == 100.0
 
 
+def test_score_joints_all_masks_matches_compute_accuracy():
+    """
+    Test that scoring joint positions against every mask at once gives one
+    score per mask, each equal to the trial score compute_accuracy gives for
+    that mask, with a perfect score only for the mask the image was taken
+    from.
+    """
+    test_model = HoleInTheCameraGame()
+    test_image = cv2.imread("images/poses/first_mask.png")
+    test_model.analyze_frame(test_image)
+    test_model.parse_for_joint_positions()
+    scores = test_model.score_joints(test_model.joint_positions)
+    assert scores.shape == (7,)
+    for score, (_, test_csv) in zip(scores, test_model.mask_and_joints):
+        test_model.compute_accuracy(test_csv)
+        assert score == test_model.trial_score
+    assert scores[0] == 100.0
+    assert np.all(scores[1:] < 100)
+
+
 def test_computer_accuracy_diff_image_total_score():
     """
     Test that when an image is analyzed and compared to against a different
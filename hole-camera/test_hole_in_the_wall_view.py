@@ -328,6 +328,29 @@ def test_display_frame_screen_pixel_values():
     assert np.mean(pixel_values) > 0 and np.mean(pixel_values) < 255
 
 
+def test_display_frame_with_pose():
+    """
+    Test that a pose passed to display_frame is drawn over the frame without
+    changing the camera frame itself.
+    """
+    test_view = PygameViewer((640, 480))
+    test_view.initialize_view()
+    test_frame = np.zeros((480, 640, 3), np.uint8)
+    test_mask = np.full((480, 640, 3), 255, np.uint8)
+    # a neck and a right shoulder joined by a limb
+    candidate = np.array([[320, 100, 0.9, 0], [260, 100, 0.9, 1]])
+    subset = -1 * np.ones((1, 20))
+    subset[0, 1] = 0
+    subset[0, 2] = 1
+    test_view.display_frame(test_frame, "10", test_mask, (candidate, subset))
+    pixel_values = pygame.surfarray.array3d(test_view.screen)
+    pygame.quit()
+    assert not test_frame.any()
+    # the frame is rotated onto the screen, so frame pixel (x=290, y=100)
+    # on the limb is shown at (349, 100)
+    assert pixel_values[349, 100].any()
+
+
 def test_display_win_screen_width():
     """
     Test that the win game screen has correct width.
@@ -0,0 +1,51 @@
+"""
+Test functions for the stage_accuracy_report.py script.
+"""
+
+from stage_accuracy_report import read_reference_joints, compare_joints,\
+    evaluate_stages
+
+
+def test_read_reference_joints_size():
+    """
+    Test that read_reference_joints returns all eighteen joints of a mask.
+    """
+    assert len(read_reference_joints("first_mask")) == 18
+
+
+def test_compare_joints_identical():
+    """
+    Test that comparing a mask's joints against themselves gives no distance
+    and no missing joints.
+    """
+    reference = read_reference_joints("first_mask")
+    distances, missing = compare_joints(reference, reference)
+    assert max(distances) == 0 and missing == 0
+
+
+def test_compare_joints_skips_absent_reference_joints():
+    """
+    Test that joints absent from the reference are neither compared nor
+    counted as missing.
+    """
+    reference = {"0": [10.0, 10.0], "1": [-1.0, -1.0]}
+    detected = {"0": [13.0, 14.0], "1": [-1, -1]}
+    assert compare_joints(reference, detected) == ([5.0], 0)
+
+
+def test_compare_joints_missing():
+    """
+    Test that reference joints that were not detected are counted as missing.
+    """
+    reference = {"0": [10.0, 10.0], "1": [20.0, 20.0]}
+    detected = {"0": [10.0, 10.0], "1": [-1, -1]}
+    assert compare_joints(reference, detected) == ([0.0], 1)
+
+
+def test_evaluate_stages_full_network():
+    """
+    Test that the full six-stage network reproduces the saved joint positions
+    it was used to create.
+    """
+    result = evaluate_stages(6)
+    assert result["missing"] == 0 and result["mean_error"] < 1
@@ -4,13 +4,13 @@ Create csv files representing joints positions for each mask.
 import csv
 import os
 import cv2
-from deep_pose.body import Body
+from deep_pose.engine import shared_engine
 
 # Create directories if they don't exist
 os.makedirs("images/joints", exist_ok=True)
 
-# OpenPose instance used to analyze camera frames.
-BODY_ESTIMATION = Body("deep_pose/body_pose_model.pth")
+# OpenPose engine used to analyze camera frames, shared with the game model.
+BODY_ESTIMATION = shared_engine("deep_pose/body_pose_model.pth", profile=True)
 
 # List of image names to analyze.
 MASK_NAMES = ["sergipe_mask"]
@@ -42,7 +42,58 @@ def analyze_image(image_name):
     
     # Analyze the image for joint positions
     joint_candidates, joint_subsets = BODY_ESTIMATION(image)
-    
+    return parse_joint_positions(image_path, joint_candidates, joint_subsets)
+
+def analyze_images(image_names):
+    """
+    This function analyzes several images at once and returns the joint
+    positions found within each of them. Images of the same size are run
+    through OpenPose together as one batch.
+
+    Args:
+        image_names (list): The names of the images to analyze.
+
+    Returns:
+        dict: A dictionary where each key is an image name and each value is
+            the dictionary of joint positions analyze_image would return.
+    """
+    all_joint_positions = {image_name: {} for image_name in image_names}
+
+    # Read the images and group them by size, since a batch needs equal sizes
+    batches = {}
+    for image_name in image_names:
+        image_path = f"images/poses/{image_name}.png"
+        image = cv2.imread(image_path)
+        if image is None:
+            print(f"Error: Could not read image {image_path}")
+            continue
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        batches.setdefault(image.shape, []).append((image_name, image))
+
+    # Analyze each batch with a single forward pass
+    for batch in batches.values():
+        results = BODY_ESTIMATION.batch([image for _, image in batch])
+        for (image_name, _), result in zip(batch, results):
+            joint_candidates, joint_subsets = result
+            image_path = f"images/poses/{image_name}.png"
+            all_joint_positions[image_name] = parse_joint_positions(
+                image_path, joint_candidates, joint_subsets)
+
+    return all_joint_positions
+
+def parse_joint_positions(image_path, joint_candidates, joint_subsets):
+    """
+    This function picks the joint subset with the most joints found in an
+    image and returns its joint positions.
+
+    Args:
+        image_path (str): The path of the analyzed image, used in messages.
+        joint_candidates (numpy array): All joints recognized by OpenPose.
+        joint_subsets (numpy array): The joints grouped by person.
+
+    Returns:
+        dict: A dictionary of joint positions, as returned by analyze_image.
+    """
     # If no joint subsets are found, return an empty dictionary
     if len(joint_subsets) == 0:
         print(f"Error: No joint subsets found in image {image_path}")
@@ -89,9 +140,10 @@ def main():
     """
     This is the runner function to create and save joint positions.
     """
+    print(f"Analyzing {len(MASK_NAMES)} masks...")
+    all_joint_positions = analyze_images(MASK_NAMES)
     for mask_name in MASK_NAMES:
-        print(f"Analyzing {mask_name}...")
-        joint_positions = analyze_image(mask_name)
+        joint_positions = all_joint_positions[mask_name]
         if joint_positions:
             save_joint_positions(mask_name, joint_positions)
         else:
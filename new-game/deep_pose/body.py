@@ -5,91 +5,642 @@ script is used to generate the joint candidates and subsets that we use to
 detect a user's fit into a mask.
 """
 
+import collections
+import contextlib
+import os
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+import warnings
 import cv2
 import numpy as np
-import math
-import time
 from scipy.ndimage.filters import gaussian_filter
 # import matplotlib.pyplot as plt
 import torch
-from torchvision import transforms
+import torch.nn.functional as F
 
 import deep_pose.util as util
-from deep_pose.model import bodypose_model
+from deep_pose.artifact import artifact_path, is_fresh, load_artifact
+from deep_pose.model import bodypose_model, fold_input_normalization
+from deep_pose.onnx_backend import OnnxRuntimeModel, export_onnx, is_fresh_export, onnx_model_path
+from deep_pose.profiler import StageProfiler
 # import util
 # from model import bodypose_model
 
+def resize_padded(oriImg, scale, stride=8, padValue=128, buffers=None):
+    """Resize a frame by scale and pad it down and right to a multiple of stride.
+
+    Returns the padded H x W x 3 frame and the (height, width) of the resized
+    frame before padding. buffers, a dict, keeps one padded frame per size:
+    its padding is written once, when it is created, and only the image area
+    is overwritten for later frames of the same size.
+    """
+    imageToTest = cv2.resize(oriImg, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    h, w = imageToTest.shape[:2]
+    key = (h, w, imageToTest.dtype.str)
+    padded = None if buffers is None else buffers.get(key)
+    if padded is None:
+        padded = np.full((h + (-h) % stride, w + (-w) % stride, 3), padValue, dtype=imageToTest.dtype)
+        if buffers is not None:
+            buffers[key] = padded
+    padded[:h, :w] = imageToTest
+    return padded, (h, w)
+
+def normalize_input(data):
+    """Map 0-255 pixel values onto the [-0.5, 0.5) range the network was trained on."""
+    return data / 256 - 0.5
+
+def cpu_supports_bf16():
+    """Whether this CPU has native bfloat16 arithmetic (AVX512-BF16 or AMX)."""
+    for check in ('_is_avx512_bf16_supported', '_is_amx_tile_supported'):
+        if getattr(torch.cpu, check, lambda: False)():
+            return True
+    return False
+
+def paf_sampler(score_mid):
+    """Sample a full-resolution limb PAF (H x W x 2) at the nearest pixel."""
+    def sample(xs, ys):
+        return score_mid[np.rint(ys).astype(int), np.rint(xs).astype(int)]
+    return sample
+
+def lowres_paf_sampler(paf, channels, to_grid):
+    """Bilinearly sample two channels of a stride-resolution PAF (38 x h x w).
+
+    to_grid maps image coordinates onto the PAF grid, so only the points the
+    limb scoring asks for are ever interpolated.
+    """
+    h, w = paf.shape[1:]
+    def sample(xs, ys):
+        gx, gy = to_grid(xs, ys)
+        gx = np.clip(gx, 0, w - 1)
+        gy = np.clip(gy, 0, h - 1)
+        x0 = np.floor(gx).astype(int)
+        y0 = np.floor(gy).astype(int)
+        x1 = np.minimum(x0 + 1, w - 1)
+        y1 = np.minimum(y0 + 1, h - 1)
+        wx = gx - x0
+        wy = gy - y0
+        out = []
+        for c in channels:
+            grid = paf[c]
+            top = grid[y0, x0] * (1 - wx) + grid[y0, x1] * wx
+            bottom = grid[y1, x0] * (1 - wx) + grid[y1, x1] * wx
+            out.append(top * (1 - wy) + bottom * wy)
+        return np.stack(out, axis=-1)
+    return sample
+
+def lowres_grid(output, resized_shape, stride, size=None):
+    """One scale's network output (1 x C x h x w) on its valid stride grid.
+
+    Cells past ceil(resized_shape / stride) only saw padding and are cropped.
+    With size (width, height) the C x h x w result is resized onto that grid,
+    so scales padded differently line up before they are averaged.
+    """
+    rows = -(-resized_shape[0] // stride)
+    cols = -(-resized_shape[1] // stride)
+    grid = np.squeeze(output, 0)[:, :rows, :cols]
+    if size is None or size == (cols, rows):
+        return grid
+    grid = cv2.resize(np.transpose(grid, (1, 2, 0)), size, interpolation=cv2.INTER_LINEAR)
+    return np.transpose(grid, (2, 0, 1))
+
+def find_peaks_lowres(heatmap, thre1, to_image, image_shape):
+    """Find part peaks on the stride-resolution heatmap (19 x h x w).
+
+    Non-maximum suppression for all 18 parts is a single 3x3 max-pool
+    against thre1 (a scalar or one threshold per part), each peak is refined
+    to sub-pixel accuracy with a parabola through its neighbours, and
+    to_image maps it back to image coordinates. Peaks that land in the
+    padding outside the image are dropped. Returns all_peaks in the same
+    (x, y, score, id) layout as the full-resolution search.
+    """
+    heat = np.ascontiguousarray(heatmap[:18], dtype=np.float32)
+    heat_t = torch.from_numpy(heat)[None]
+    thre_t = torch.from_numpy(np.broadcast_to(np.float32(thre1), (18,)).reshape(1, 18, 1, 1).copy())
+    peaks_binary = (heat_t == F.max_pool2d(heat_t, 3, stride=1, padding=1)) & (heat_t > thre_t)
+    part, ys, xs = np.nonzero(peaks_binary[0].numpy())
+
+    padded = np.pad(heat, ((0, 0), (1, 1), (1, 1)), mode='edge')
+    centre = heat[part, ys, xs].astype(np.float64)
+
+    def offset(before, after):
+        denom = before - 2 * centre + after
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = np.where(denom < 0, 0.5 * (before - after) / denom, 0)
+        return np.clip(delta, -0.5, 0.5)
+
+    dx = offset(padded[part, ys + 1, xs], padded[part, ys + 1, xs + 2])
+    dy = offset(padded[part, ys, xs + 1], padded[part, ys + 2, xs + 1])
+    X, Y = to_image(xs + dx, ys + dy)
+    inside = (X <= image_shape[1] - 0.5) & (Y <= image_shape[0] - 0.5)
+    X = np.clip(X, 0, image_shape[1] - 1)
+    Y = np.clip(Y, 0, image_shape[0] - 1)
+
+    all_peaks = []
+    peak_counter = 0
+    for p in range(18):
+        keep = np.nonzero((part == p) & inside)[0]
+        all_peaks.append([(X[i], Y[i], centre[i], peak_counter + n) for n, i in enumerate(keep)])
+        peak_counter += len(keep)
+    return all_peaks
+
+def part_thresholds(heatmaps, thre1, sigmas=None):
+    """Peak threshold of each of the 18 part heatmaps.
+
+    Without sigmas every part uses thre1. Otherwise a part whose heatmap is
+    noisy (mean + sigmas * std above thre1) uses that value instead, so
+    background clutter does not turn into peaks.
+    """
+    thresholds = np.full(18, thre1)
+    if sigmas is not None:
+        for part, heatmap in enumerate(heatmaps):
+            spread = heatmap.mean(dtype=np.float64) + sigmas * heatmap.std(dtype=np.float64)
+            thresholds[part] = max(thre1, spread)
+    return thresholds
+
+def limit_peaks(all_peaks, max_peaks):
+    """Keep the max_peaks highest-scoring peaks of every part.
+
+    Kept peaks stay in their original order and are renumbered so ids remain
+    consecutive. Returns the limited all_peaks and how many peaks were dropped.
+    """
+    limited = []
+    peak_counter = 0
+    dropped = 0
+    for peaks in all_peaks:
+        if len(peaks) > max_peaks:
+            keep = np.sort(np.argsort([-peak[2] for peak in peaks], kind='stable')[:max_peaks])
+            dropped += len(peaks) - max_peaks
+            peaks = [peaks[i] for i in keep]
+        limited.append([peak[:3] + (peak_counter + n,) for n, peak in enumerate(peaks)])
+        peak_counter += len(peaks)
+    return limited, dropped
+
+def connect_limb(candA, candB, sample_paf, img_height, mid_num=10, thre2=0.05):
+    """Score every (candA, candB) pair of one limb against its PAF at once.
+
+    All nA x nB pairs are sampled at mid_num points along the segment with a
+    single call to sample_paf, and both criteria are evaluated as array
+    operations. The result is the same connection array the per-pair loop
+    produced: rows of [idA, idB, score, i, j], greedily matched by score.
+    """
+    candA = np.asarray(candA, dtype=np.float64)
+    candB = np.asarray(candB, dtype=np.float64)
+    nA, nB = len(candA), len(candB)
+
+    vec = candB[np.newaxis, :, :2] - candA[:, np.newaxis, :2]
+    norm = np.sqrt(vec[..., 0] * vec[..., 0] + vec[..., 1] * vec[..., 1])
+    norm = np.maximum(0.001, norm)
+    vec = vec / norm[..., np.newaxis]
+
+    # same arithmetic as np.linspace so the sampled pixels do not move
+    steps = np.arange(mid_num, dtype=np.float64)
+    start = np.broadcast_to(candA[:, np.newaxis, :2], (nA, nB, 2))
+    stop = np.broadcast_to(candB[np.newaxis, :, :2], (nA, nB, 2))
+    startend = steps[:, np.newaxis] * ((stop - start) / (mid_num - 1))[..., np.newaxis, :] \
+        + start[..., np.newaxis, :]
+    startend[..., -1, :] = stop
+    samples = sample_paf(startend[..., 0], startend[..., 1])  # nA x nB x mid_num x 2
+    score_midpts = samples[..., 0] * vec[..., 0, np.newaxis] + samples[..., 1] * vec[..., 1, np.newaxis]
+
+    # accumulate left to right like the builtin sum did
+    total = np.zeros((nA, nB))
+    for I in range(mid_num):
+        total += score_midpts[..., I]
+    score_with_dist_prior = total / mid_num + np.minimum(0.5 * img_height / norm - 1, 0)
+    criterion1 = np.count_nonzero(score_midpts > thre2, axis=-1) > 0.8 * mid_num
+    criterion2 = score_with_dist_prior > 0
+
+    cand_i, cand_j = np.nonzero(criterion1 & criterion2)
+    cand_s = score_with_dist_prior[cand_i, cand_j]
+    order = np.argsort(-cand_s, kind='stable')
+
+    connection = []
+    used_i, used_j = set(), set()
+    for c in order:
+        i, j, s = cand_i[c], cand_j[c], cand_s[c]
+        if i not in used_i and j not in used_j:
+            connection.append([candA[i][3], candB[j][3], s, i, j])
+            used_i.add(i)
+            used_j.add(j)
+            if len(connection) >= min(nA, nB):
+                break
+    return np.array(connection).reshape(-1, 5)
+
+def assemble_people(connection_all, special_k, candidate, limbSeq):
+    """Group the per-limb connections into people.
+
+    Applies the same greedy rules as the original scan over every subset
+    row, but rows live in a table preallocated for the worst case, each
+    candidate remembers the rows it was written to, and merged people are
+    joined with union-find instead of being deleted from the table. Returns
+    subset as an n x 20 array: 0-17 index into candidate, 18 is the total
+    score and 19 the number of parts.
+    """
+    capacity = sum(len(connection_all[k]) for k in range(len(connection_all)) if k not in special_k)
+    # last number in each row is the total parts number of that person
+    # the second last number in each row is the score of the overall configuration
+    table = -1 * np.ones((capacity, 20))
+    parent = list(range(capacity))
+    rows_of = {}
+    n_rows = 0
+
+    def find(r):
+        while parent[r] != r:
+            parent[r] = parent[parent[r]]
+            r = parent[r]
+        return r
+
+    def rows_with(part, cand):
+        roots = {find(r) for r in rows_of.get(cand, ())}
+        return {r for r in roots if table[r, part] == cand}
+
+    def put(row, part, cand):
+        table[row, part] = cand
+        rows_of.setdefault(cand, []).append(row)
+
+    for k in range(len(limbSeq)):
+        if k in special_k:
+            continue
+        indexA, indexB = np.array(limbSeq[k]) - 1
+        for partA, partB, score, _, _ in connection_all[k]:
+            partA, partB = int(partA), int(partB)
+            # roots are the oldest row of each person, so sorting them keeps
+            # the order the rows would have had in the old growing table
+            found_rows = sorted(rows_with(indexA, partA) | rows_with(indexB, partB))
+            found = len(found_rows)
+
+            if found == 1:
+                j = found_rows[0]
+                if table[j, indexB] != partB:
+                    put(j, indexB, partB)
+                    table[j, -1] += 1
+                    table[j, -2] += candidate[partB, 2] + score
+            elif found >= 2:  # if found 2 and disjoint, merge them
+                j1, j2 = found_rows[:2]
+                if not np.any((table[j1, :-2] >= 0) & (table[j2, :-2] >= 0)):  # merge
+                    table[j1, :-2] += (table[j2, :-2] + 1)
+                    table[j1, -2:] += table[j2, -2:]
+                    table[j1, -2] += score
+                    parent[j2] = j1
+                else:  # as like found == 1
+                    put(j1, indexB, partB)
+                    table[j1, -1] += 1
+                    table[j1, -2] += candidate[partB, 2] + score
+
+            # if find no partA in the subset, create a new subset
+            elif k < 17:
+                j = n_rows
+                n_rows += 1
+                put(j, indexA, partA)
+                put(j, indexB, partB)
+                table[j, -1] = 2
+                table[j, -2] = candidate[partA, 2] + candidate[partB, 2] + score
+
+    alive = np.array([parent[r] == r for r in range(n_rows)], dtype=bool)
+    subset = table[:n_rows][alive]
+    # delete some rows of subset which has few parts occur
+    keep = ~((subset[:, -1] < 4) | (subset[:, -2] / subset[:, -1] < 0.4))
+    return subset[keep]
+
+def top_peaks(all_peaks):
+    """Keep only the highest-scoring peak of each part, renumbering the ids."""
+    peaks = []
+    peak_counter = 0
+    for part_peaks in all_peaks:
+        if len(part_peaks) == 0:
+            peaks.append([])
+            continue
+        best = max(part_peaks, key=lambda peak: peak[2])
+        peaks.append([tuple(best[:3]) + (peak_counter,)])
+        peak_counter += 1
+    return peaks
+
+class LimbConnections(dict):
+    """Connections of each limb by index k, scored by connect(k) on first use."""
+
+    def __init__(self, connect):
+        super().__init__()
+        self.connect = connect
+
+    def __missing__(self, k):
+        self[k] = connection = self.connect(k)
+        return connection
+
+def assemble_single(all_peaks, connection_all, limbSeq):
+    """Build the subset of a single person from the top peak of each part.
+
+    Parts joined by a verified limb are unioned and the largest group (by
+    part count, then score) becomes the only row. As in assemble_people, a
+    limb between parts already in one group adds nothing, and the limbs
+    closing the ear-shoulder cycles (k >= 17) only extend a group that holds
+    their shoulder. The row is filtered with the same rules, so the result
+    is an n x 20 array with at most one row.
+
+    connection_all is only indexed for limbs that can still change the
+    person, so it may be a LimbConnections that scores limbs on demand.
+    """
+    parent = list(range(18))
+
+    def find(p):
+        while parent[p] != p:
+            parent[p] = parent[parent[p]]
+            p = parent[p]
+        return p
+
+    joined = set()
+    limb_scores = []
+    for k in range(len(limbSeq)):
+        indexA, indexB = np.array(limbSeq[k]) - 1
+        if find(indexA) == find(indexB):
+            continue
+        if k >= 17 and indexA not in joined:
+            continue
+        if len(connection_all[k]) == 0:
+            continue
+        parent[find(indexB)] = find(indexA)
+        joined.update((indexA, indexB))
+        limb_scores.append((indexA, connection_all[k][0][2]))
+
+    best = None
+    for root in sorted({find(part) for part in joined}):
+        parts = [part for part in sorted(joined) if find(part) == root]
+        row = -1 * np.ones(20)
+        for part in parts:
+            row[part] = all_peaks[part][0][3]
+        row[-1] = len(parts)
+        row[-2] = sum(all_peaks[part][0][2] for part in parts) \
+            + sum(score for part, score in limb_scores if find(part) == root)
+        if best is None or (row[-1], row[-2]) > (best[-1], best[-2]):
+            best = row
+
+    if best is None or best[-1] < 4 or best[-2] / best[-1] < 0.4:
+        return -1 * np.ones((0, 20))
+    return best[np.newaxis]
+
+def assemble_heatmap(all_peaks):
+    """Build the subset of a single person from the top peak of each part alone.
+
+    Without PAFs no limb is verified: the row holds every part found and is
+    kept if it has at least 4 of them. Returns an n x 20 array with at most
+    one row, like assemble_single.
+    """
+    row = -1 * np.ones(20)
+    for part, peaks in enumerate(all_peaks):
+        if len(peaks) > 0:
+            row[part] = peaks[0][3]
+    row[-1] = sum(len(peaks) > 0 for peaks in all_peaks)
+    row[-2] = sum(peaks[0][2] for peaks in all_peaks if len(peaks) > 0)
+    if row[-1] < 4:
+        return -1 * np.ones((0, 20))
+    return row[np.newaxis]
+
 class Body(object):
-    def __init__(self, model_path):
-        self.model = bodypose_model()
-        if torch.cuda.is_available():
-            self.model = self.model.cuda()
-        model_dict = util.transfer(self.model, torch.load(model_path))
-        self.model.load_state_dict(model_dict)
+    """OpenPose body estimator.
+
+    peak_mode selects how part peaks are found: 'full' upsamples the heatmap
+    and PAF to frame size first (the reference behaviour), 'lowres' runs NMS
+    on the stride-resolution heatmap with sub-pixel refinement and samples
+    the PAF only along candidate limbs.
+
+    mode='single' assumes one player: only the top peak of each part is
+    kept, its limbs are verified against the PAF and at most one subset row
+    is returned, skipping the grouping across people. mode='heatmap' keeps
+    the top peak of each part too but never computes the PAFs: the last
+    stage's PAF branch is skipped (for the PyTorch float models; int8 and
+    onnxruntime still compute it) along with all PAF upsampling and limb
+    scoring, and the found parts form the only subset row.
+
+    stages (1-6) is passed to bodypose_model: fewer refinement stages trade
+    accuracy for speed.
+
+    precision='int8' runs the statically quantized model written next to
+    model_path by `python -m deep_pose.quantize`, with a warning when it is
+    older than model_path; precision='bf16' runs the float model under
+    bfloat16 autocast, falling back to float32 on CPUs without native
+    bfloat16 support.
+
+    Float models start from the artifact written by `python -m
+    deep_pose.artifact` when it is up to date, and from model_path otherwise.
+
+    backend='onnxruntime' exports the float model to ONNX once, caching it
+    next to model_path, and runs it on onnxruntime's CPU execution provider.
+
+    Frames are resized into a persistent, stride-aligned buffer per input
+    size. For the PyTorch float models the /256 - 0.5 normalization is
+    folded into conv1_1 at load time, so the buffer is fed as raw pixels.
+
+    scale_search lists the scales, relative to a 368 pixel high input, at
+    which the network runs; their outputs are averaged in float32, and the
+    heatmaps are smoothed for the peak search in float64.
+    batch_scales=True runs all scales in one forward pass, each input padded
+    to the size of the largest; it defaults to True on CUDA only, as on CPU
+    the padding costs more than the single pass saves.
+
+    profile=True times every call per stage (resize, forward, upsample,
+    peaks, paf, assembly and total); stats() summarizes the recent samples.
+    Profiling can also be switched at runtime through profiler.enabled.
+
+    max_peaks caps the number of peaks kept per part (the highest scoring
+    ones), which bounds the limb pairs scored to max_peaks ** 2 per limb.
+    adaptive_threshold=k raises a part's peak threshold to mean + k * std of
+    its heatmap when that is above the fixed 0.1. counters records how many
+    frames hit either limit.
+
+    lean=True keeps the frame-size work arrays (the float32 heatmap and PAF
+    of each scale and their averages, the smoothed heatmap, the peak masks)
+    per thread and reuses them on every call instead of allocating new ones.
+    Like the padded network inputs, they are kept for the CACHED_SIZES most
+    recently seen frame sizes only, so a stream of crop sizes (RoiBody) does
+    not grow memory without bound. While tracemalloc is tracing, peak_memory
+    holds the peak bytes allocated through Python (including numpy, but not
+    torch) during the last call or batch.
+
+    batch(frames) runs a list of same-size frames through the network in a
+    single forward pass per scale and post-processes them on a thread pool.
+    Each frame's post-processing is profiled as its 'total'.
+    """
+
+    PEAK_MODES = ('full', 'lowres')
+    MODES = ('multi', 'single', 'heatmap')
+    PRECISIONS = ('fp32', 'bf16', 'int8')
+    BACKENDS = ('torch', 'onnxruntime')
+    BOXSIZE = 368
+    STRIDE = 8
+    PAD_VALUE = 128
+    CACHED_SIZES = 2
+
+    def __init__(self, model_path, peak_mode='full', mode='multi', stages=6, precision='fp32',
+                 backend='torch', scale_search=(0.5,), batch_scales=None, max_peaks=None,
+                 adaptive_threshold=None, lean=False, profile=False):
+        if peak_mode not in self.PEAK_MODES:
+            raise ValueError("peak_mode must be one of %s" % (self.PEAK_MODES,))
+        if mode not in self.MODES:
+            raise ValueError("mode must be one of %s" % (self.MODES,))
+        if precision not in self.PRECISIONS:
+            raise ValueError("precision must be one of %s" % (self.PRECISIONS,))
+        if backend not in self.BACKENDS:
+            raise ValueError("backend must be one of %s" % (self.BACKENDS,))
+        if backend == 'onnxruntime' and precision != 'fp32':
+            raise ValueError("the onnxruntime backend only runs in fp32")
+        self.peak_mode = peak_mode
+        self.mode = mode
+        self.backend = backend
+        self.scale_search = list(scale_search)
+        self.max_peaks = max_peaks
+        self.adaptive_threshold = adaptive_threshold
+        self.lean = lean
+        self.peak_memory = None
+        self._work = threading.local()
+        self.counters = collections.Counter()
+        self._counters_lock = threading.Lock()
+        on_cpu = precision == 'int8' or backend == 'onnxruntime'
+        self.device = 'cuda' if torch.cuda.is_available() and not on_cpu else 'cpu'
+        if precision == 'bf16' and self.device == 'cpu' and not cpu_supports_bf16():
+            warnings.warn("this CPU has no native bfloat16 support, running Body in float32")
+            precision = 'fp32'
+        self.precision = precision
+        self.batch_scales = self.device == 'cuda' if batch_scales is None else batch_scales
+
+        if backend == 'onnxruntime':
+            onnx_path = onnx_model_path(model_path, stages)
+            if not is_fresh_export(onnx_path, model_path):
+                export_onnx(self._load_float_model(model_path, stages), onnx_path)
+            self.model = OnnxRuntimeModel(onnx_path)
+        elif precision == 'int8':
+            quantized_path = util.quantized_model_path(model_path, stages)
+            if not os.path.exists(quantized_path):
+                raise FileNotFoundError(
+                    "%s not found, run `python -m deep_pose.quantize` to calibrate it" % quantized_path)
+            if not util.is_up_to_date(quantized_path, model_path):
+                warnings.warn("%s is older than %s, run `python -m deep_pose.quantize` to recalibrate it"
+                              % (quantized_path, model_path))
+            self.model = torch.jit.load(quantized_path, map_location='cpu')
+        else:
+            self.model = fold_input_normalization(self._load_float_model(model_path, stages))
+            self.model.heatmap_only = mode == 'heatmap'
+        self.input_folded = backend == 'torch' and precision != 'int8'
         self.model.eval()
-
-    def __call__(self, oriImg):
-        # scale_search = [0.5, 1.0, 1.5, 2.0]
-        scale_search = [0.5]
-        boxsize = 368
-        stride = 8
-        padValue = 128
-        thre1 = 0.1
-        thre2 = 0.05
-        multiplier = [x * boxsize / oriImg.shape[0] for x in scale_search]
-        heatmap_avg = np.zeros((oriImg.shape[0], oriImg.shape[1], 19))
-        paf_avg = np.zeros((oriImg.shape[0], oriImg.shape[1], 38))
-
-        for m in range(len(multiplier)):
-            scale = multiplier[m]
-            imageToTest = cv2.resize(oriImg, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
-            imageToTest_padded, pad = util.padRightDownCorner(imageToTest, stride, padValue)
-            im = np.transpose(np.float32(imageToTest_padded[:, :, :, np.newaxis]), (3, 2, 0, 1)) / 256 - 0.5
-            im = np.ascontiguousarray(im)
-
-            data = torch.from_numpy(im).float()
-            if torch.cuda.is_available():
-                data = data.cuda()
-            # data = data.permute([2, 0, 1]).unsqueeze(0).float()
-            with torch.no_grad():
+        self._buffers = collections.OrderedDict()
+        self.profiler = StageProfiler(profile)
+
+    def _load_float_model(self, model_path, stages):
+        if is_fresh(model_path):
+            return load_artifact(artifact_path(model_path), stages).to(self.device)
+        model = bodypose_model(stages).to(self.device)
+        model_dict = util.transfer(model, torch.load(model_path, map_location=self.device))
+        model.load_state_dict(model_dict)
+        return model
+
+    def _prepare_input(self, oriImg, scale, stride, padValue):
+        """Resize oriImg into the padded buffer for its size and return the network input.
+
+        See resize_padded; the float input tensor of each padded size is
+        reused as well.
+        """
+        buffers = self._cached(self._buffers, oriImg.shape[:2], dict)
+        padded, resized_shape = resize_padded(oriImg, scale, stride, padValue, buffers)
+        key = ('input',) + padded.shape[:2]
+        if key not in buffers:
+            buffers[key] = torch.empty((1, 3) + padded.shape[:2], dtype=torch.float32, device=self.device)
+        data = buffers[key]
+        # one pass converts the HWC frame to the float NCHW input
+        data[0].copy_(torch.from_numpy(padded).permute(2, 0, 1))
+        if not self.input_folded:
+            data = normalize_input(data)
+        return data, resized_shape
+
+    def _forward(self, data):
+        """Run the network on data; returns its PAF and heatmap outputs as numpy arrays.
+
+        A model that skipped its PAF branch gives a PAF output with no channels.
+        """
+        with self.profiler('forward'):
+            with torch.no_grad(), self._autocast():
                 Mconv7_stage6_L1, Mconv7_stage6_L2 = self.model(data)
-            Mconv7_stage6_L1 = Mconv7_stage6_L1.cpu().numpy()
-            Mconv7_stage6_L2 = Mconv7_stage6_L2.cpu().numpy()
-
-            # extract outputs, resize, and remove padding
-            # heatmap = np.transpose(np.squeeze(net.blobs[output_blobs.keys()[1]].data), (1, 2, 0))  # output 1 is heatmaps
-            heatmap = np.transpose(np.squeeze(Mconv7_stage6_L2), (1, 2, 0))  # output 1 is heatmaps
-            heatmap = cv2.resize(heatmap, (0, 0), fx=stride, fy=stride, interpolation=cv2.INTER_CUBIC)
-            heatmap = heatmap[:imageToTest_padded.shape[0] - pad[2], :imageToTest_padded.shape[1] - pad[3], :]
-            heatmap = cv2.resize(heatmap, (oriImg.shape[1], oriImg.shape[0]), interpolation=cv2.INTER_CUBIC)
-
-            # paf = np.transpose(np.squeeze(net.blobs[output_blobs.keys()[0]].data), (1, 2, 0))  # output 0 is PAFs
-            paf = np.transpose(np.squeeze(Mconv7_stage6_L1), (1, 2, 0))  # output 0 is PAFs
-            paf = cv2.resize(paf, (0, 0), fx=stride, fy=stride, interpolation=cv2.INTER_CUBIC)
-            paf = paf[:imageToTest_padded.shape[0] - pad[2], :imageToTest_padded.shape[1] - pad[3], :]
-            paf = cv2.resize(paf, (oriImg.shape[1], oriImg.shape[0]), interpolation=cv2.INTER_CUBIC)
-
-            heatmap_avg += heatmap_avg + heatmap / len(multiplier)
-            paf_avg += + paf / len(multiplier)
-
+            Mconv7_stage6_L2 = Mconv7_stage6_L2.float().cpu().numpy()
+            if Mconv7_stage6_L1 is None:
+                shape = Mconv7_stage6_L2.shape
+                return np.zeros((shape[0], 0) + shape[2:], np.float32), Mconv7_stage6_L2
+            return Mconv7_stage6_L1.float().cpu().numpy(), Mconv7_stage6_L2
+
+    def _scale_outputs(self, oriImg, multiplier):
+        """Network outputs and resized shape of every scale, from one forward pass.
+
+        Each scale's input goes into the top-left corner of a batch padded to
+        the largest one, and its outputs are cropped back to its own stride grid.
+        """
+        stride = self.STRIDE
+        with self.profiler('resize'):
+            inputs = []
+            for scale in multiplier:
+                data, resized_shape = self._prepare_input(oriImg, scale, stride, self.PAD_VALUE)
+                # scales of the same size share a buffer
+                inputs.append((data.clone(), resized_shape))
+            height = max(data.shape[2] for data, _ in inputs)
+            width = max(data.shape[3] for data, _ in inputs)
+            pad = self.PAD_VALUE if self.input_folded else normalize_input(self.PAD_VALUE)
+            batch = inputs[0][0].new_full((len(inputs), 3, height, width), pad)
+            for i, (data, _) in enumerate(inputs):
+                batch[i, :, :data.shape[2], :data.shape[3]] = data[0]
+        Mconv7_stage6_L1, Mconv7_stage6_L2 = self._forward(batch)
+        outputs = []
+        for i, (data, resized_shape) in enumerate(inputs):
+            h, w = data.shape[2] // stride, data.shape[3] // stride
+            outputs.append((Mconv7_stage6_L1[i:i + 1, :, :h, :w], Mconv7_stage6_L2[i:i + 1, :, :h, :w],
+                            resized_shape))
+        return outputs
+
+    def _work_buffer(self, name, shape, dtype=np.float32):
+        """Uninitialized work array; in lean mode the same one is returned on every call."""
+        if not self.lean:
+            return np.empty(shape, dtype)
+        # batch() post-processes frames on several threads at once
+        sizes = self._work.__dict__.setdefault('buffers', collections.OrderedDict())
+        # every work array has the frame's height and width
+        buffers = self._cached(sizes, shape[:2], dict)
+        key = (name, shape)
+        if key not in buffers:
+            buffers[key] = np.empty(shape, dtype)
+        return buffers[key]
+
+    def _cached(self, cache, size, create):
+        """cache[size], made by create() if missing; only the CACHED_SIZES most recent sizes are kept."""
+        if size in cache:
+            cache.move_to_end(size)
+        else:
+            cache[size] = create()
+            while len(cache) > self.CACHED_SIZES:
+                cache.popitem(last=False)
+        return cache[size]
+
+    def _autocast(self):
+        if self.precision == 'bf16':
+            return torch.autocast(device_type=self.device, dtype=torch.bfloat16)
+        return contextlib.nullcontext()
+
+    def _find_peaks(self, heatmap_avg, thre1):
+        thre1 = np.broadcast_to(thre1, (18,))
         all_peaks = []
         peak_counter = 0
+        shape = heatmap_avg.shape[:2]
+        # the averages are float32, but smoothing and the neighbour tests run
+        # in float64 so ties break as they did on the float64 averages
+        smoothed = self._work_buffer('smoothed', shape, np.float64)
+        peaks_binary = self._work_buffer('peaks', shape, bool)
+        neighbour = self._work_buffer('neighbour', shape, bool)
 
         for part in range(18):
             map_ori = heatmap_avg[:, :, part]
-            one_heatmap = gaussian_filter(map_ori, sigma=3)
-
-            map_left = np.zeros(one_heatmap.shape)
-            map_left[1:, :] = one_heatmap[:-1, :]
-            map_right = np.zeros(one_heatmap.shape)
-            map_right[:-1, :] = one_heatmap[1:, :]
-            map_up = np.zeros(one_heatmap.shape)
-            map_up[:, 1:] = one_heatmap[:, :-1]
-            map_down = np.zeros(one_heatmap.shape)
-            map_down[:, :-1] = one_heatmap[:, 1:]
-
-            peaks_binary = np.logical_and.reduce(
-                (one_heatmap >= map_left, one_heatmap >= map_right, one_heatmap >= map_up, one_heatmap >= map_down, one_heatmap > thre1))
+            one_heatmap = gaussian_filter(map_ori, sigma=3, output=smoothed)
+
+            # at least as high as the 4 neighbours; outside the map counts as
+            # 0, which any value above the (positive) threshold beats
+            np.greater(one_heatmap, thre1[part], out=peaks_binary)
+            for here, there in ((np.s_[1:, :], np.s_[:-1, :]), (np.s_[:-1, :], np.s_[1:, :]),
+                                (np.s_[:, 1:], np.s_[:, :-1]), (np.s_[:, :-1], np.s_[:, 1:])):
+                np.greater_equal(one_heatmap[here], one_heatmap[there], out=neighbour[here])
+                peaks_binary[here] &= neighbour[here]
             peaks = list(zip(np.nonzero(peaks_binary)[1], np.nonzero(peaks_binary)[0]))  # note reverse
             peaks_with_score = [x + (map_ori[x[1], x[0]],) for x in peaks]
             peak_id = range(peak_counter, peak_counter + len(peaks))
@@ -97,6 +648,163 @@ class Body(object):
 
             all_peaks.append(peaks_with_score_and_id)
             peak_counter += len(peaks)
+        return all_peaks
+
+    def _count_frame(self, raised, dropped):
+        """Count one frame, its raised thresholds and its dropped peaks in counters."""
+        # batch() post-processes frames on several threads at once
+        with self._counters_lock:
+            self.counters['frames'] += 1
+            if raised:
+                self.counters['threshold_raised_frames'] += 1
+                self.counters['raised_thresholds'] += raised
+            if dropped:
+                self.counters['peak_limited_frames'] += 1
+                self.counters['dropped_peaks'] += dropped
+
+    def stats(self):
+        """Per-stage latency summary in milliseconds, see StageProfiler.stats."""
+        return self.profiler.stats()
+
+    def __call__(self, oriImg):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        result = self._timed_estimate(oriImg)
+        if tracing:
+            self.peak_memory = tracemalloc.get_traced_memory()[1] - before
+        return result
+
+    def batch(self, frames, workers=None):
+        """Estimate the poses in a list of frames of the same size.
+
+        The frames are stacked into one network input per scale; the results
+        are then post-processed on `workers` threads (one per CPU by default).
+        Returns one (candidate, subset) per frame, as __call__ would.
+        """
+        if len(frames) == 0:
+            return []
+        shape = frames[0].shape
+        if any(frame.shape != shape for frame in frames):
+            raise ValueError("batch frames must all have the same shape")
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        outputs = [[] for _ in frames]
+        for x in self.scale_search:
+            scale = x * self.BOXSIZE / shape[0]
+            with self.profiler('resize'):
+                data = None
+                for i, frame in enumerate(frames):
+                    frame_data, resized_shape = self._prepare_input(frame, scale, self.STRIDE, self.PAD_VALUE)
+                    if data is None:
+                        data = frame_data.new_empty((len(frames),) + tuple(frame_data.shape[1:]))
+                    data[i] = frame_data[0]
+            Mconv7_stage6_L1, Mconv7_stage6_L2 = self._forward(data)
+            for i in range(len(frames)):
+                outputs[i].append((Mconv7_stage6_L1[i:i + 1], Mconv7_stage6_L2[i:i + 1], resized_shape))
+        with ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+            results = list(pool.map(self._timed_estimate, frames, outputs))
+        if tracing:
+            self.peak_memory = tracemalloc.get_traced_memory()[1] - before
+        return results
+
+    def _timed_estimate(self, oriImg, outputs=None):
+        # 'total' of a batch frame leaves out the forward pass it shares
+        with self.profiler('total'):
+            return self._estimate(oriImg, outputs)
+
+    def _estimate(self, oriImg, outputs=None):
+        """Pose estimation on oriImg; outputs optionally holds the network
+        outputs and resized shape of each scale, as computed by batch."""
+        # scale_search = [0.5, 1.0, 1.5, 2.0]
+        scale_search = self.scale_search
+        boxsize = self.BOXSIZE
+        stride = self.STRIDE
+        padValue = self.PAD_VALUE
+        thre1 = 0.1
+        thre2 = 0.05
+        multiplier = [x * boxsize / oriImg.shape[0] for x in scale_search]
+        lowres = self.peak_mode == 'lowres'
+        with_paf = self.mode != 'heatmap'
+        if not lowres:
+            heatmap_avg = self._work_buffer('heatmap_avg', oriImg.shape[:2] + (19,))
+            heatmap_avg.fill(0)
+            if with_paf:
+                paf_avg = self._work_buffer('paf_avg', oriImg.shape[:2] + (38,))
+                paf_avg.fill(0)
+        if outputs is None and self.batch_scales and len(multiplier) > 1:
+            outputs = self._scale_outputs(oriImg, multiplier)
+
+        for m in range(len(multiplier)):
+            scale = multiplier[m]
+            if outputs is not None:
+                Mconv7_stage6_L1, Mconv7_stage6_L2, resized_shape = outputs[m]
+            else:
+                with self.profiler('resize'):
+                    data, resized_shape = self._prepare_input(oriImg, scale, stride, padValue)
+
+                # data = data.permute([2, 0, 1]).unsqueeze(0).float()
+                Mconv7_stage6_L1, Mconv7_stage6_L2 = self._forward(data)
+
+            with self.profiler('upsample'):
+                if lowres:
+                    # stay on the valid stride grid of the first scale
+                    if m == 0:
+                        heatmap_avg = lowres_grid(Mconv7_stage6_L2, resized_shape, stride) / len(multiplier)
+                        grid_scale = (heatmap_avg.shape[2] / oriImg.shape[1],
+                                      heatmap_avg.shape[1] / oriImg.shape[0])
+                        if with_paf:
+                            paf_avg = lowres_grid(Mconv7_stage6_L1, resized_shape, stride) / len(multiplier)
+                    else:
+                        size = (heatmap_avg.shape[2], heatmap_avg.shape[1])
+                        heatmap_avg += lowres_grid(Mconv7_stage6_L2, resized_shape, stride, size) / len(multiplier)
+                        if with_paf:
+                            paf_avg += lowres_grid(Mconv7_stage6_L1, resized_shape, stride, size) / len(multiplier)
+                else:
+                    # extract outputs, resize, and remove padding
+                    # heatmap = np.transpose(np.squeeze(net.blobs[output_blobs.keys()[1]].data), (1, 2, 0))  # output 1 is heatmaps
+                    heatmap = np.transpose(np.squeeze(Mconv7_stage6_L2), (1, 2, 0))  # output 1 is heatmaps
+                    heatmap = cv2.resize(heatmap, (0, 0), fx=stride, fy=stride, interpolation=cv2.INTER_CUBIC)
+                    heatmap = heatmap[:resized_shape[0], :resized_shape[1], :]
+                    heatmap = cv2.resize(heatmap, (oriImg.shape[1], oriImg.shape[0]), interpolation=cv2.INTER_CUBIC,
+                                         dst=self._work_buffer('heatmap', heatmap_avg.shape))
+
+                    heatmap /= len(multiplier)
+                    heatmap_avg += heatmap
+
+                    if with_paf:
+                        # paf = np.transpose(np.squeeze(net.blobs[output_blobs.keys()[0]].data), (1, 2, 0))  # output 0 is PAFs
+                        paf = np.transpose(np.squeeze(Mconv7_stage6_L1), (1, 2, 0))  # output 0 is PAFs
+                        paf = cv2.resize(paf, (0, 0), fx=stride, fy=stride, interpolation=cv2.INTER_CUBIC)
+                        paf = paf[:resized_shape[0], :resized_shape[1], :]
+                        paf = cv2.resize(paf, (oriImg.shape[1], oriImg.shape[0]), interpolation=cv2.INTER_CUBIC,
+                                         dst=self._work_buffer('paf', paf_avg.shape))
+                        paf /= len(multiplier)
+                        paf_avg += paf
+
+        with self.profiler('peaks'):
+            if lowres:
+                def to_image(x, y):
+                    return (x + 0.5) / grid_scale[0] - 0.5, (y + 0.5) / grid_scale[1] - 0.5
+
+                def to_grid(x, y):
+                    return (x + 0.5) * grid_scale[0] - 0.5, (y + 0.5) * grid_scale[1] - 0.5
+
+                thresholds = part_thresholds(heatmap_avg[:18], thre1, self.adaptive_threshold)
+                all_peaks = find_peaks_lowres(heatmap_avg, thresholds, to_image, oriImg.shape)
+            else:
+                thresholds = part_thresholds(np.moveaxis(heatmap_avg[:, :, :18], 2, 0), thre1,
+                                             self.adaptive_threshold)
+                all_peaks = self._find_peaks(heatmap_avg, thresholds)
+            dropped = 0
+            if self.max_peaks is not None:
+                all_peaks, dropped = limit_peaks(all_peaks, self.max_peaks)
+            self._count_frame(int(np.sum(thresholds > thre1)), dropped)
+            if self.mode != 'multi':
+                all_peaks = top_peaks(all_peaks)
 
         # find connection in the specified sequence, center 29 is in the position 15
         limbSeq = [[2, 3], [2, 6], [3, 4], [4, 5], [6, 7], [7, 8], [2, 9], [9, 10], \
@@ -118,109 +826,43 @@ class Body(object):
         # limbSeq = [[2, 3], [3, 4], [4, 5]]
         # mapIdx = [[31, 32], [33, 34], [35, 36]]
 
-        connection_all = []
         special_k = []
         mid_num = 10
 
-        for k in range(len(mapIdx)):
-            score_mid = paf_avg[:, :, [x - 19 for x in mapIdx[k]]]
+        if not with_paf:
+            with self.profiler('assembly'):
+                candidate = np.array([item for sublist in all_peaks for item in sublist])
+                subset = assemble_heatmap(all_peaks)
+            return candidate, subset
+
+        def connect(k):
+            channels = [x - 19 for x in mapIdx[k]]
+            if lowres:
+                sample_paf = lowres_paf_sampler(paf_avg, channels, to_grid)
+            else:
+                sample_paf = paf_sampler(paf_avg[:, :, channels])
             candA = all_peaks[limbSeq[k][0] - 1]
             candB = all_peaks[limbSeq[k][1] - 1]
-            nA = len(candA)
-            nB = len(candB)
-            indexA, indexB = limbSeq[k]
-            if (nA != 0 and nB != 0):
-                connection_candidate = []
-                for i in range(nA):
-                    for j in range(nB):
-                        vec = np.subtract(candB[j][:2], candA[i][:2])
-                        norm = math.sqrt(vec[0] * vec[0] + vec[1] * vec[1])
-                        norm = max(0.001, norm)
-                        vec = np.divide(vec, norm)
-
-                        startend = list(zip(np.linspace(candA[i][0], candB[j][0], num=mid_num), \
-                                            np.linspace(candA[i][1], candB[j][1], num=mid_num)))
-
-                        vec_x = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 0] \
-                                          for I in range(len(startend))])
-                        vec_y = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 1] \
-                                          for I in range(len(startend))])
-
-                        score_midpts = np.multiply(vec_x, vec[0]) + np.multiply(vec_y, vec[1])
-                        score_with_dist_prior = sum(score_midpts) / len(score_midpts) + min(
-                            0.5 * oriImg.shape[0] / norm - 1, 0)
-                        criterion1 = len(np.nonzero(score_midpts > thre2)[0]) > 0.8 * len(score_midpts)
-                        criterion2 = score_with_dist_prior > 0
-                        if criterion1 and criterion2:
-                            connection_candidate.append(
-                                [i, j, score_with_dist_prior, score_with_dist_prior + candA[i][2] + candB[j][2]])
-
-                connection_candidate = sorted(connection_candidate, key=lambda x: x[2], reverse=True)
-                connection = np.zeros((0, 5))
-                for c in range(len(connection_candidate)):
-                    i, j, s = connection_candidate[c][0:3]
-                    if (i not in connection[:, 3] and j not in connection[:, 4]):
-                        connection = np.vstack([connection, [candA[i][3], candB[j][3], s, i, j]])
-                        if (len(connection) >= min(nA, nB)):
-                            break
-
-                connection_all.append(connection)
+            if (len(candA) != 0 and len(candB) != 0):
+                return connect_limb(candA, candB, sample_paf, oriImg.shape[0], mid_num, thre2)
+            special_k.append(k)
+            return []
+
+        with self.profiler('paf'):
+            if self.mode == 'single':
+                # the limbs closing the ear-shoulder cycles are scored during
+                # assembly, and only when they can still extend the person
+                connection_all = LimbConnections(connect)
+                connection_all.update((k, connect(k)) for k in range(17))
+            else:
+                connection_all = [connect(k) for k in range(len(mapIdx))]
+
+        with self.profiler('assembly'):
+            candidate = np.array([item for sublist in all_peaks for item in sublist])
+            if self.mode == 'single':
+                subset = assemble_single(all_peaks, connection_all, limbSeq)
             else:
-                special_k.append(k)
-                connection_all.append([])
-
-        # last number in each row is the total parts number of that person
-        # the second last number in each row is the score of the overall configuration
-        subset = -1 * np.ones((0, 20))
-        candidate = np.array([item for sublist in all_peaks for item in sublist])
-
-        for k in range(len(mapIdx)):
-            if k not in special_k:
-                partAs = connection_all[k][:, 0]
-                partBs = connection_all[k][:, 1]
-                indexA, indexB = np.array(limbSeq[k]) - 1
-
-                for i in range(len(connection_all[k])):  # = 1:size(temp,1)
-                    found = 0
-                    subset_idx = [-1, -1]
-                    for j in range(len(subset)):  # 1:size(subset,1):
-                        if subset[j][indexA] == partAs[i] or subset[j][indexB] == partBs[i]:
-                            subset_idx[found] = j
-                            found += 1
-
-                    if found == 1:
-                        j = subset_idx[0]
-                        if subset[j][indexB] != partBs[i]:
-                            subset[j][indexB] = partBs[i]
-                            subset[j][-1] += 1
-                            subset[j][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
-                    elif found == 2:  # if found 2 and disjoint, merge them
-                        j1, j2 = subset_idx
-                        membership = ((subset[j1] >= 0).astype(int) + (subset[j2] >= 0).astype(int))[:-2]
-                        if len(np.nonzero(membership == 2)[0]) == 0:  # merge
-                            subset[j1][:-2] += (subset[j2][:-2] + 1)
-                            subset[j1][-2:] += subset[j2][-2:]
-                            subset[j1][-2] += connection_all[k][i][2]
-                            subset = np.delete(subset, j2, 0)
-                        else:  # as like found == 1
-                            subset[j1][indexB] = partBs[i]
-                            subset[j1][-1] += 1
-                            subset[j1][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
-
-                    # if find no partA in the subset, create a new subset
-                    elif not found and k < 17:
-                        row = -1 * np.ones(20)
-                        row[indexA] = partAs[i]
-                        row[indexB] = partBs[i]
-                        row[-1] = 2
-                        row[-2] = sum(candidate[connection_all[k][i, :2].astype(int), 2]) + connection_all[k][i][2]
-                        subset = np.vstack([subset, row])
-        # delete some rows of subset which has few parts occur
-        deleteIdx = []
-        for i in range(len(subset)):
-            if subset[i][-1] < 4 or subset[i][-2] / subset[i][-1] < 0.4:
-                deleteIdx.append(i)
-        subset = np.delete(subset, deleteIdx, axis=0)
+                subset = assemble_people(connection_all, special_k, candidate, limbSeq)
 
         # subset: n*20 array, 0-17 is the index in candidate, 18 is the total score, 19 is the total parts
         # candidate: x, y, score, id
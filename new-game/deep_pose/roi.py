@@ -0,0 +1,91 @@
+"""
+Region-of-interest pose estimation driven by the previous detection.
+
+Body scales every input so its height maps to the same network resolution,
+so a player standing far from the camera ends up only a few dozen pixels
+tall. RoiBody crops each frame around the player found in the previous one,
+with a margin, so the network spends its resolution on the player and
+processes fewer pixels, then maps the joints back to frame coordinates.
+"""
+
+import numpy as np
+
+from deep_pose.tracker import person_with_most_joints
+
+
+class RoiBody:
+    """Run a pose estimator on a crop around the previous detection.
+
+    body is any callable returning (candidate, subset), such as Body or a
+    PoseEngine. The crop is the bounding box of the previous player's joints
+    grown by `margin` times its size on every side, at least min_height
+    times the frame height tall and min_aspect times its height wide (so
+    raised arms stay inside), and snapped outwards to multiples of `step`
+    pixels. A player who moves a little then usually keeps the same crop
+    size, so Body can reuse the buffers it keeps for its most recent input
+    sizes (see Body.CACHED_SIZES). The whole frame is analysed on the first
+    call, every `refresh` calls, and whenever the crop shows nobody.
+    """
+
+    def __init__(self, body, margin=0.3, min_height=0.3, min_aspect=0.75,
+                 step=32, refresh=30):
+        self.body = body
+        self.margin = margin
+        self.min_height = min_height
+        self.min_aspect = min_aspect
+        self.step = step
+        self.refresh = refresh
+        self.roi_calls = 0
+        self.full_calls = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the player; the next call analyses the whole frame."""
+        self.roi = None
+        self._since_full = 0
+
+    def crop_for(self, joints, frame_shape):
+        """(x0, y0, x1, y1) crop around the found joints, or None if none."""
+        found = joints[~np.isnan(joints[:, 0])]
+        if len(found) == 0:
+            return None
+        height, width = frame_shape[:2]
+        (x0, y0), (x1, y1) = found.min(axis=0), found.max(axis=0)
+        grow_y = max(self.margin * (y1 - y0),
+                     (self.min_height * height - (y1 - y0)) / 2)
+        crop_height = y1 - y0 + 2 * grow_y
+        grow_x = max(self.margin * (x1 - x0),
+                     (self.min_aspect * crop_height - (x1 - x0)) / 2)
+        x0, x1 = x0 - grow_x, x1 + grow_x
+        y0, y1 = y0 - grow_y, y1 + grow_y
+        x0 = max(0, int(x0 // self.step * self.step))
+        y0 = max(0, int(y0 // self.step * self.step))
+        x1 = min(width, int(-(-x1 // self.step) * self.step))
+        y1 = min(height, int(-(-y1 // self.step) * self.step))
+        return x0, y0, x1, y1
+
+    def __call__(self, frame):
+        if self.roi is not None and self._since_full < self.refresh:
+            x0, y0, x1, y1 = self.roi
+            candidate, subset = self.body(frame[y0:y1, x0:x1])
+            if len(subset) > 0:
+                self.roi_calls += 1
+                self._since_full += 1
+                candidate = np.array(candidate, dtype=float)
+                candidate[:, 0] += x0
+                candidate[:, 1] += y0
+                return self._remember(candidate, subset, frame.shape)
+        self.full_calls += 1
+        self._since_full = 0
+        candidate, subset = self.body(frame)
+        return self._remember(candidate, subset, frame.shape)
+
+    def _remember(self, candidate, subset, frame_shape):
+        joints = person_with_most_joints(candidate, subset)
+        self.roi = self.crop_for(joints, frame_shape)
+        return candidate, subset
+
+    def stats(self):
+        """How many calls ran on a crop and how many on the whole frame."""
+        return {'roi_calls': self.roi_calls, 'full_calls': self.full_calls,
+                'roi': self.roi}
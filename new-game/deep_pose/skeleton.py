@@ -0,0 +1,92 @@
+"""
+Single-pass skeleton overlay.
+
+util.draw_bodypose used to copy the canvas and blend the whole frame once
+per limb of every person, up to 17 full-frame cv2.addWeighted calls for a
+single player. SkeletonRenderer draws every limb into one overlay covering
+only the region the skeletons span, blends it into the frame once and then
+draws the joints on top, which is cheap enough to run on every camera frame.
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+# parts joined by each limb, numbered from 1 as in Body
+LIMB_SEQUENCE = [[2, 3], [2, 6], [3, 4], [4, 5], [6, 7], [7, 8], [2, 9],
+                 [9, 10], [10, 11], [2, 12], [12, 13], [13, 14], [2, 1],
+                 [1, 15], [15, 17], [1, 16], [16, 18]]
+
+COLORS = [[255, 0, 0], [255, 85, 0], [255, 170, 0], [255, 255, 0],
+          [170, 255, 0], [85, 255, 0], [0, 255, 0], [0, 255, 85],
+          [0, 255, 170], [0, 255, 255], [0, 170, 255], [0, 85, 255],
+          [0, 0, 255], [85, 0, 255], [170, 0, 255], [255, 0, 255],
+          [255, 0, 170], [255, 0, 85]]
+
+
+class SkeletonRenderer:
+    """Draw the poses found by Body onto frames.
+
+    Limbs are ellipses stick_width pixels thick blended in with the given
+    alpha; joints are opaque circles of joint_radius pixels. antialias=True
+    smooths their edges with cv2.LINE_AA.
+    """
+
+    def __init__(self, stick_width=4, joint_radius=4, alpha=0.6,
+                 antialias=True):
+        self.stick_width = stick_width
+        self.joint_radius = joint_radius
+        self.alpha = alpha
+        self.antialias = antialias
+
+    def limb_polygons(self, candidate, subset):
+        """(polygon, color) of every limb whose two parts were found."""
+        limbs = []
+        for i, (part_a, part_b) in enumerate(LIMB_SEQUENCE):
+            for row in subset:
+                index_a, index_b = int(row[part_a - 1]), int(row[part_b - 1])
+                if index_a == -1 or index_b == -1:
+                    continue
+                x0, y0 = candidate[index_a][0:2]
+                x1, y1 = candidate[index_b][0:2]
+                length = math.hypot(x0 - x1, y0 - y1)
+                angle = math.degrees(math.atan2(y0 - y1, x0 - x1))
+                center = (int((x0 + x1) / 2), int((y0 + y1) / 2))
+                axes = (int(length / 2), self.stick_width)
+                polygon = cv2.ellipse2Poly(center, axes, int(angle), 0, 360,
+                                           1)
+                limbs.append((polygon, COLORS[i]))
+        return limbs
+
+    def draw(self, canvas, candidate, subset):
+        """Draw the poses in (candidate, subset) onto canvas in place.
+
+        Returns canvas.
+        """
+        line_type = cv2.LINE_AA if self.antialias else cv2.LINE_8
+        limbs = self.limb_polygons(candidate, subset)
+        if limbs:
+            points = np.concatenate([polygon for polygon, _ in limbs])
+            # anti-aliased edges reach one pixel past the polygons
+            left, top = np.maximum(points.min(axis=0) - 1, 0)
+            right, bottom = np.minimum(points.max(axis=0) + 2,
+                                       (canvas.shape[1], canvas.shape[0]))
+            if right > left and bottom > top:
+                region = canvas[top:bottom, left:right]
+                overlay = region.copy()
+                offset = np.array([left, top], np.int32)
+                for polygon, color in limbs:
+                    cv2.fillConvexPoly(overlay, polygon - offset, color,
+                                       line_type)
+                canvas[top:bottom, left:right] = cv2.addWeighted(
+                    region, 1 - self.alpha, overlay, self.alpha, 0)
+        for part in range(18):
+            for row in subset:
+                index = int(row[part])
+                if index == -1:
+                    continue
+                x, y = candidate[index][0:2]
+                cv2.circle(canvas, (int(x), int(y)), self.joint_radius,
+                           COLORS[part], -1, line_type)
+        return canvas
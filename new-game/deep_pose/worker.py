@@ -0,0 +1,245 @@
+"""
+Out-of-process pose estimation.
+
+PoseWorker runs Body in a separate process so the network neither blocks the
+pygame loop nor competes with it for the GIL. Frames are copied into a ring
+of shared-memory slots and only (request id, slot, shape) travels over the
+request queue; (candidate, subset) come back over a result queue and resolve
+the concurrent.futures.Future returned by submit(). A slot is reused only
+once its result is back, so submit() blocks while every slot is in flight.
+stats() fetches the Body profiler summary from the worker the same way. If
+the worker process dies, every pending and later request fails with a
+RuntimeError instead of waiting forever.
+"""
+
+import atexit
+import itertools
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Seconds between checks that the worker process is still alive
+ALIVE_POLL = 0.5
+
+
+def _serve(shm_name, slot_bytes, requests, results, model_path,
+           warmup_shape, options):
+    """Worker process: load Body, then answer requests until None arrives."""
+    from deep_pose.body import Body
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        try:
+            body = Body(model_path, **options)
+            body(np.zeros(warmup_shape, np.uint8))
+            body.profiler.reset()
+        except Exception as error:
+            results.put((None, None, error))
+            return
+        results.put((None, None, None))
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            request_id, slot, shape, dtype = request
+            if slot is None:
+                results.put((request_id, body.stats(), None))
+                continue
+            frame = np.ndarray(shape, dtype, buffer=shm.buf,
+                               offset=slot * slot_bytes)
+            try:
+                results.put((request_id, body(frame), None))
+            except Exception as error:
+                results.put((request_id, None, error))
+            del frame
+    finally:
+        shm.close()
+
+
+class PoseWorker:
+    """Body running in a worker process, fed through shared memory.
+
+    frame_shape is the largest frame submit() accepts and slots the number
+    of frames that can be in flight at once. Other keyword arguments are
+    passed to Body. The process is spawned by start(), or by the first
+    submit(); like PoseEngine, ready() and wait() report when it has loaded
+    and warmed up the model.
+    """
+
+    def __init__(self, model_path, frame_shape=(480, 640, 3), slots=2,
+                 **options):
+        self.model_path = model_path
+        self.frame_shape = tuple(frame_shape)
+        self.slots = slots
+        self.options = options
+        self._slot_bytes = int(np.prod(self.frame_shape))
+        self._lock = threading.Lock()
+        self._free_slots = threading.Semaphore(slots)
+        self._next_slot = itertools.cycle(range(slots))
+        self._request_ids = itertools.count()
+        self._pending = {}
+        self._ready = threading.Event()
+        self._error = None
+        self._process = None
+
+    def start(self):
+        """Spawn the worker process unless it is running; returns the worker.
+
+        A worker stopped by close() can be started again.
+        """
+        with self._lock:
+            if self._process is not None:
+                return self
+            # a restart after close() begins with no requests in flight
+            self._ready.clear()
+            self._error = None
+            self._pending = {}
+            self._free_slots = threading.Semaphore(self.slots)
+            # spawn keeps torch's thread pools and pygame out of the child
+            context = multiprocessing.get_context('spawn')
+            self._shm = shared_memory.SharedMemory(
+                create=True, size=self.slots * self._slot_bytes)
+            self._requests = context.Queue()
+            self._results = context.Queue()
+            self._process = context.Process(
+                target=_serve, name='pose-worker', daemon=True,
+                args=(self._shm.name, self._slot_bytes, self._requests,
+                      self._results, self.model_path, self.frame_shape,
+                      self.options))
+            self._process.start()
+            self._collector = threading.Thread(
+                target=self._collect, args=(self._process,),
+                name='pose-results', daemon=True)
+            self._collector.start()
+            atexit.register(self.close)
+        return self
+
+    def ready(self):
+        """Whether the worker has loaded the model (or failed to)."""
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        """Start the worker if needed and wait up to timeout seconds.
+
+        Returns ready().
+        """
+        self.start()
+        return self._ready.wait(timeout)
+
+    def submit(self, frame):
+        """Queue frame for pose estimation.
+
+        Returns a Future resolving to (candidate, subset), or raising the
+        error the worker hit. Raises ValueError if frame does not fit a slot.
+        """
+        frame = np.asarray(frame)
+        if frame.nbytes > self._slot_bytes:
+            raise ValueError("a %s frame of shape %s does not fit the "
+                             "worker's uint8 %s slots"
+                             % (frame.dtype, frame.shape, self.frame_shape))
+        self._check_running()
+        self._free_slots.acquire()
+        with self._lock:
+            slot = next(self._next_slot)
+            # slots are released in any order, so skip those still in flight
+            while any(pending_slot == slot
+                      for _, pending_slot in self._pending.values()):
+                slot = next(self._next_slot)
+            request_id, future = self._new_request(slot)
+        target = np.ndarray(frame.shape, frame.dtype, buffer=self._shm.buf,
+                            offset=slot * self._slot_bytes)
+        target[...] = frame
+        self._requests.put((request_id, slot, frame.shape, frame.dtype.str))
+        return future
+
+    def stats(self):
+        """Per-stage latency summary of the worker's Body, see Body.stats."""
+        self._check_running()
+        with self._lock:
+            request_id, future = self._new_request(None)
+        self._requests.put((request_id, None, None, None))
+        return future.result()
+
+    def _check_running(self):
+        self.wait()
+        if self._error is not None:
+            raise self._error
+
+    def _new_request(self, slot):
+        if self._error is not None:
+            # the worker died while this request waited for a slot
+            if slot is not None:
+                self._free_slots.release()
+            raise self._error
+        request_id = next(self._request_ids)
+        future = Future()
+        self._pending[request_id] = (future, slot)
+        return request_id, future
+
+    def _collect(self, process):
+        while True:
+            try:
+                message = self._results.get(timeout=ALIVE_POLL)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+                # close() stops the process itself and fails what is pending
+                if self._process is process:
+                    self._fail(RuntimeError(
+                        "pose worker process exited with code %s"
+                        % process.exitcode))
+                break
+            if message is None:
+                break  # sentinel from close()
+            request_id, result, error = message
+            if request_id is None:
+                self._error = error
+                self._ready.set()
+                continue
+            with self._lock:
+                future, slot = self._pending.pop(request_id)
+            if slot is not None:
+                self._free_slots.release()
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _fail(self, error):
+        """Fail every pending request, and every later one, with error."""
+        with self._lock:
+            if self._error is None:
+                self._error = error
+            pending, self._pending = self._pending, {}
+        self._ready.set()
+        for future, slot in pending.values():
+            if slot is not None:
+                self._free_slots.release()
+            future.set_exception(error)
+
+    def close(self):
+        """Stop the worker process and free the shared memory."""
+        with self._lock:
+            if self._process is None:
+                return
+            process, self._process = self._process, None
+        self._requests.put(None)
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+        self._ready.set()
+        self._results.put(None)
+        self._collector.join(timeout=1)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future, slot in pending.values():
+            if slot is not None:
+                self._free_slots.release()
+            future.set_exception(RuntimeError("pose worker closed"))
+        self._shm.close()
+        self._shm.unlink()
+        atexit.unregister(self.close)
@@ -8,9 +8,11 @@ https://github.com/Hzzone/pytorch-openpose
 """
 import csv
 import random
+from concurrent.futures import Future
 from cv2 import cv2 as cv
 import numpy as np
-from deep_pose.body import Body
+from deep_pose.engine import shared_engine
+from deep_pose.worker import PoseWorker
 
 
 class ShapeSEGame:
@@ -18,7 +20,10 @@ class ShapeSEGame:
     SHAPE-SE game model with helper functions that dictate gameflow.
 
     Attributes:
-        BODY_ESTIMATION (Body): Body estimation object from open pose.
+        BODY_ESTIMATION (PoseEngine): Shared, lazily loaded body estimation
+            object from open pose.
+        POSE_WORKER (PoseWorker): Open pose running in a separate process,
+            used by analyze_frame_async.
         MASK_NAMES (list): List of names of each mask, represented as strings.
         _mask_and_joints (list): List of tuples, where each tuple contains the
             string file path to the mask that a user should fit into and a
@@ -38,8 +43,15 @@ class ShapeSEGame:
         _total_score (int): The total score of the user.
     """
 
-    # Instance of Body class from open pose that will be used to analyze frames.
-    BODY_ESTIMATION = Body("deep_pose/body_pose_model.pth")
+    # Open pose engine shared by the whole process that will be used to analyze
+    # frames with analyze_frame. Its weights are loaded on first use.
+    BODY_ESTIMATION = shared_engine("deep_pose/body_pose_model.pth",
+                                    profile=True)
+
+    # Open pose worker process, started by the runner so that analyzing the
+    # final frame does not freeze the game window. The runner sends it only
+    # that final frame, so its stats() cover one frame per game.
+    POSE_WORKER = PoseWorker("deep_pose/body_pose_model.pth", profile=True)
 
     # List of each mask that will be available for users to play with.
     MASK_NAMES = ["sergipe_mask"]
@@ -126,6 +138,32 @@ class ShapeSEGame:
         self._joint_candidates, self._joint_subsets =\
             self.BODY_ESTIMATION(frame)
 
+    def analyze_frame_async(self, frame):
+        """
+        This function sends the inputted frame to the open pose worker process
+        and returns right away. Once the worker is done, the joints are stored
+        to _joint_candidates and _joint_subsets as analyze_frame would.
+
+        Args:
+            frame (numpy.ndarray): A 3-D numpy array that represents the RGB
+                values of the frame to be analyzed by open pose. This frame
+                array should be of size 480x640x3.
+        Returns:
+            (Future): A future that is done once the joints are stored, or
+                that raises the error the worker ran into.
+        """
+        stored = Future()
+
+        def store_joints(analysis):
+            if analysis.exception() is not None:
+                stored.set_exception(analysis.exception())
+                return
+            self._joint_candidates, self._joint_subsets = analysis.result()
+            stored.set_result(None)
+
+        self.POSE_WORKER.submit(frame).add_done_callback(store_joints)
+        return stored
+
     def parse_for_joint_positions(self):
         """
         This function parses the joint candidates and subsets to find the
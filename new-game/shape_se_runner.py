@@ -4,6 +4,7 @@ Main runner code for SHAPE-SE game.
 import sys
 import os
 import time
+from concurrent.futures import wait
 from datetime import datetime
 from shape_se_controller import OpenCVController
 from shape_se_view import PygameViewer
@@ -13,10 +14,24 @@ from shape_se_model import ShapeSEGame
 CAMERA_INDEX = 0
 DISPLAY_SIZE = (640, 480)
 GAME_DURATION = 300  # 5 minutes in seconds
+LOADING_POLL = 0.05  # seconds between checks for the loaded pose model
+ANALYSIS_POLL = 0.03  # seconds to wait for the final analysis between frames
 
 # Create snapshots directory if it doesn't exist
 os.makedirs("snapshots", exist_ok=True)
 
+def load_pose_engine():
+    """
+    Start the pose worker process and wait for it to load and warm up the
+    pose model while the loading screen is displayed.
+    """
+    engine = ShapeSEGame.POSE_WORKER.start()
+    game_view.display_loading()
+    # keep handling window events until the model is ready
+    while not engine.wait(LOADING_POLL):
+        if game_controller.next_screen() == "quit":
+            sys.exit()
+
 def game_play():
     """
     Run the main game loop.
@@ -50,8 +65,15 @@ def game_play():
             final_frame = current_frame
             break
     
-    # Analyze the final frame
-    game_model.analyze_frame(final_frame)
+    # Analyze the final frame in the pose worker while the camera view keeps
+    # updating
+    analysis = game_model.analyze_frame_async(final_frame)
+    while not wait([analysis], timeout=ANALYSIS_POLL).done:
+        game_view.display_frame(game_controller.get_display_frame(),
+                                current_timer_value, mask)
+        if game_controller.next_screen() == "quit":
+            sys.exit()
+    analysis.result()
     game_model.parse_for_joint_positions()
     accuracy = game_model.compute_accuracy(joints_file)
     
@@ -97,6 +119,7 @@ if __name__ == "__main__":
     
     # Initialize the view
     game_view.initialize_view()
+    load_pose_engine()
     
     # Set the current game state
     current_game_state = "game_play"
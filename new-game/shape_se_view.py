@@ -32,6 +32,12 @@ class ShapeSEView(ABC):
         Initialize the game view.
         """
 
+    @abstractmethod
+    def display_loading(self):
+        """
+        Display the loading screen shown while the pose model loads.
+        """
+
     @abstractmethod
     def display_frame(self, frame, timer_text, camera_mask, flag_overlay=None):
         """
@@ -120,6 +126,17 @@ class PygameViewer(ShapeSEView):
         pygame.display.set_caption("SHAPE-SE")
         self._font = pygame.font.SysFont(self._FONT, self._FONT_SIZE)
 
+    def display_loading(self):
+        """
+        Display the loading screen shown while the pose model loads.
+        """
+        self._screen.fill(self._BLACK)
+        loading_text = self._font.render("Carregando...", 1, self._WHITE)
+        loading_rect = loading_text.get_rect(
+            center=self._screen.get_rect().center)
+        self._screen.blit(loading_text, loading_rect)
+        pygame.display.update()
+
     def _overlay_flag(self, frame):
         """
         Overlay the Sergipe flag on the frame with transparency.